@@ -1,6 +1,6 @@
 """
 # Libraries to install
-uv add google-cloud-bigquery
+uv add google-cloud-bigquery pyarrow
 
 # Run this in shell before running python etl.py
 gcloud auth application-default login
@@ -9,8 +9,20 @@ gcloud auth application-default login
 import os
 import json
 import time
+import queue
+import argparse
+import hashlib
+import sqlite3
+import uuid
+import threading
 import requests
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from google.cloud import bigquery
 from google.api_core.exceptions import NotFound
@@ -26,7 +38,53 @@ GCP_BQ_DATASET = os.getenv("GCP_BQ_DATASET")  # default dataset name
 GCP_BQ_TABLE = os.getenv("GCP_BQ_TABLE")  # default table name 
 
 # Alpaca Market Data API URL for daily bars (v2)
-BASE_URL = "https://data.alpaca.markets/v2/stocks"
+# Override ALPACA_DATA_URL to point the extractor at a local stub server.
+BASE_URL = os.getenv("ALPACA_DATA_URL", "https://data.alpaca.markets/v2/stocks")
+
+# Extraction settings
+REQUESTS_PER_MINUTE = 200    # Alpaca basic plan limit
+SYMBOLS_PER_REQUEST = 100    # Tickers per multi-symbol request
+PAGE_LIMIT = 10000           # Max bars per page
+MAX_WORKERS = 8              # Concurrent extraction threads
+QUEUE_SIZE = 16              # Batches buffered between pipeline stages
+
+# Local state for incremental loads and backfill checkpoints
+WATERMARK_DB = os.getenv("ETL_WATERMARK_DB", "./etl_state.db")
+
+# Backfill settings
+BACKFILL_WINDOW_DAYS = 365   # Date span of one backfill work unit
+
+# Bulk load chunking: flush a chunk when either limit is reached
+CHUNK_ROWS = 500_000
+CHUNK_BYTES = 128 * 1024 * 1024
+# Daily runs use much smaller chunks: watermarks only advance when a chunk lands,
+# and ~10k rows is about one symbol batch (100 tickers x 90 days)
+STREAM_CHUNK_ROWS = 10_000
+
+# Arrow schema matching the BigQuery table schema
+BAR_SCHEMA = pa.schema([
+    ("ticker", pa.string()),
+    ("date", pa.timestamp("s", tz="UTC")),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+    ("volume_weighted", pa.float64()),
+    ("num_trades", pa.int64()),
+])
+
+# Alpaca bar keys for each table column
+BAR_FIELDS = {
+    "date": "t",
+    "open": "o",
+    "high": "h",
+    "low": "l",
+    "close": "c",
+    "volume": "v",
+    "volume_weighted": "vw",
+    "num_trades": "n",
+}
 
 def set_headers(api_key, secret_key):
     """Set headers for Alpaca API requests."""
@@ -35,21 +93,170 @@ def set_headers(api_key, secret_key):
         "APCA-API-SECRET-KEY": secret_key
     }
 
-def extract_daily_stock_prices(ticker, start_date, end_date, headers):
+class RateLimiter:
+    """
+    Token bucket rate limiter shared by all extraction threads.
+    Tokens refill continuously at `rate` per second up to `capacity`.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def create_session(headers, pool_size=MAX_WORKERS, retries=3):
+    """
+    Create a pooled HTTP session with retries on rate limits and server errors.
+    """
+    session = requests.Session()
+    session.headers.update(headers)
+    retry = Retry(
+        total=retries,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_pages(session, url, params, rate_limiter=None):
+    """
+    Yield every page of an Alpaca response, following next_page_token.
+    Raises requests.HTTPError if a page can't be fetched, so callers never
+    mistake a truncated response for a complete one.
+    """
+    params = dict(params)
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire()
+        response = session.get(url, params=params)
+        if response.status_code != 200:
+            raise requests.HTTPError(
+                f"Error fetching {url}: {response.status_code} - {response.text}", response=response
+            )
+        page = response.json()
+        yield page
+        page_token = page.get("next_page_token")
+        if not page_token:
+            return
+        params["page_token"] = page_token
+
+def extract_daily_stock_prices(ticker, start_date, end_date, headers, session=None, rate_limiter=None, base_url=BASE_URL):
     """
     Extract daily stock bars for a given ticker between start_date and end_date.
+    All pages are fetched and merged into a single response.
     """
-    url = f"{BASE_URL}/{ticker}/bars?timeframe=1Day&start={start_date}&end={end_date}"
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error fetching {ticker}: {response.status_code} - {response.text}")
+    session = session or create_session(headers, pool_size=1)
+    url = f"{base_url}/{ticker}/bars"
+    params = {"timeframe": "1Day", "start": start_date, "end": end_date, "limit": PAGE_LIMIT}
+    bars = []
+    try:
+        for page in fetch_pages(session, url, params, rate_limiter):
+            bars.extend(page.get("bars") or [])
+    except requests.HTTPError as e:
+        print(e)
         return None
-    
-def transform_data(ticker, raw_data):
+    return {"bars": bars, "next_page_token": None, "symbol": ticker}
+
+def extract_stock_bars_batch(symbols, start_date, end_date, session, rate_limiter=None, base_url=BASE_URL):
     """
-    Transform the raw JSON data into a list of dictionaries matching our schema.
+    Extract daily bars for many tickers at once using the multi-symbol endpoint.
+    Returns a dict of {ticker: [bars]}, following pagination to the end.
+    """
+    url = f"{base_url}/bars"
+    params = {
+        "symbols": ",".join(symbols),
+        "timeframe": "1Day",
+        "start": start_date,
+        "end": end_date,
+        "limit": PAGE_LIMIT,
+    }
+    bars = {}
+    for page in fetch_pages(session, url, params, rate_limiter):
+        for symbol, symbol_bars in (page.get("bars") or {}).items():
+            bars.setdefault(symbol, []).extend(symbol_bars)
+    return bars
+
+def extract_all(tickers, start_date, end_date, headers,
+                batch_size=SYMBOLS_PER_REQUEST, max_workers=MAX_WORKERS,
+                requests_per_minute=REQUESTS_PER_MINUTE, base_url=BASE_URL,
+                queue_size=QUEUE_SIZE):
+    """
+    Extract daily bars for all tickers concurrently.
+    Tickers are batched into multi-symbol requests that share one pooled
+    session and one rate limiter. Yields (ticker, raw_data) as batches finish.
+    Workers hand results over through a bounded queue, so extraction pauses
+    when the consumer falls behind instead of buffering everything.
+    """
+    session = create_session(headers, pool_size=max_workers)
+    rate_limiter = RateLimiter(requests_per_minute / 60)
+    batches = queue.Queue()
+    for i in range(0, len(tickers), batch_size):
+        batches.put(tickers[i:i + batch_size])
+    results = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Block while the queue is full, unless the consumer has gone away
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def worker():
+        while not stop.is_set():
+            try:
+                batch = batches.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                bars = extract_stock_bars_batch(batch, start_date, end_date, session, rate_limiter, base_url)
+            except Exception as e:
+                print(f"Error fetching batch {batch[0]}..{batch[-1]}: {e}")
+                continue
+            put(bars)
+        put(done)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(max_workers)]
+    for thread in workers:
+        thread.start()
+    try:
+        finished = 0
+        while finished < len(workers):
+            bars = results.get()
+            if bars is done:
+                finished += 1
+                continue
+            for ticker, ticker_bars in bars.items():
+                yield ticker, {"bars": ticker_bars, "next_page_token": None, "symbol": ticker}
+    finally:
+        stop.set()
+        session.close()
+
+def transform_bars(ticker, raw_data):
+    """
+    Transform the raw JSON data straight into a typed Arrow table (BAR_SCHEMA).
+    Columns are built in Arrow rather than one Python dict per bar, and
+    timestamps are parsed into a UTC timestamp column.
     Expected raw_data structure:
       {
           'bars': [{'c': ..., 'h': ..., 'l': ..., 'n': ..., 'o': ..., 't': ..., 'v': ..., 'vw': ...}],
@@ -57,114 +264,532 @@ def transform_data(ticker, raw_data):
           'symbol': 'AAPL'
       }
     """
-    transformed = []
-    for bar in raw_data.get('bars', []):
-        transformed.append({
-            "ticker": ticker,
-            "date": bar.get("t"),             # Timestamp (e.g., "2025-03-14T04:00:00Z")
-            "open": bar.get("o"),
-            "high": bar.get("h"),
-            "low": bar.get("l"),
-            "close": bar.get("c"),
-            "volume": bar.get("v"),
-            "volume_weighted": bar.get("vw"),
-            "num_trades": bar.get("n")
-        })
-    return transformed
+    bars = raw_data.get('bars') or []
+    if not bars:
+        return BAR_SCHEMA.empty_table()
+
+    raw = pa.Table.from_pylist(bars)
+    arrays = []
+    for field in BAR_SCHEMA:
+        if field.name == "ticker":
+            arrays.append(pa.array([ticker] * raw.num_rows, field.type))
+        elif BAR_FIELDS[field.name] in raw.column_names:
+            arrays.append(raw.column(BAR_FIELDS[field.name]).cast(field.type))
+        else:
+            arrays.append(pa.nulls(raw.num_rows, field.type))
+    return pa.Table.from_arrays(arrays, schema=BAR_SCHEMA)
+
+def table_to_rows(table):
+    """
+    Convert a bar table back into a list of dictionaries.
+    Dates are formatted as ISO 8601 strings so the rows stay JSON-serializable.
+    """
+    dates = pc.strftime(table["date"], format="%Y-%m-%dT%H:%M:%SZ")
+    return table.set_column(table.schema.get_field_index("date"), "date", dates).to_pylist()
 
+def transform_data(ticker, raw_data):
+    """
+    Transform the raw JSON data into a list of dictionaries matching our schema.
+    Adapter over transform_bars for callers that need row dicts (e.g. insert_rows_json).
+    """
+    return table_to_rows(transform_bars(ticker, raw_data))
 
 # transform_data('MSFT', response)
 
 #%%
 
-def create_dataset_if_not_exists(client, dataset_id):
+class WatermarkStore:
+    """
+    Per-ticker high-watermark (timestamp of the last loaded bar) stored in SQLite.
+    Lets incremental runs pick up where the previous run stopped without GCP.
+    """
+    def __init__(self, path=WATERMARK_DB):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks (ticker TEXT PRIMARY KEY, last_date TEXT NOT NULL)"
+            )
+
+    def get_all(self, tickers):
+        """Return {ticker: last_date} for tickers that have a watermark."""
+        with self.lock:
+            rows = self.conn.execute("SELECT ticker, last_date FROM watermarks").fetchall()
+        wanted = set(tickers)
+        return {ticker: last_date for ticker, last_date in rows if ticker in wanted}
+
+    def update_table(self, table):
+        """Advance watermarks to the latest date per ticker in a bar table."""
+        latest = table.group_by("ticker").aggregate([("date", "max")])
+        dates = pc.strftime(latest["date_max"], format="%Y-%m-%dT%H:%M:%SZ")
+        self.set_many(dict(zip(latest["ticker"].to_pylist(), dates.to_pylist())))
+
+    def set_many(self, latest):
+        """Advance watermarks from a {ticker: last_date} mapping."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO watermarks (ticker, last_date) VALUES (?, ?) "
+                "ON CONFLICT(ticker) DO UPDATE SET last_date = MAX(last_date, excluded.last_date)",
+                latest.items(),
+            )
+
+def dedupe_table(table, watermark=None):
+    """
+    Dedupe a single ticker's bars: drop bars at or before the watermark
+    and repeated dates.
+    """
+    if watermark:
+        cutoff = pa.scalar(watermark).cast(BAR_SCHEMA.field("date").type)
+        table = table.filter(pc.greater(table["date"], cutoff))
+    if table.num_rows > 1:
+        table = table.sort_by("date")
+        dates = table["date"]
+        changed = pc.not_equal(dates.slice(1), dates.slice(0, table.num_rows - 1))
+        table = table.filter(pa.chunked_array([pa.array([True])] + changed.chunks))
+    return table
+
+#%%
+
+BQ_SCHEMA = [
+    bigquery.SchemaField("ticker", "STRING"),
+    bigquery.SchemaField("date", "TIMESTAMP"),
+    bigquery.SchemaField("open", "FLOAT"),
+    bigquery.SchemaField("high", "FLOAT"),
+    bigquery.SchemaField("low", "FLOAT"),
+    bigquery.SchemaField("close", "FLOAT"),
+    bigquery.SchemaField("volume", "INTEGER"),
+    bigquery.SchemaField("volume_weighted", "FLOAT"),
+    bigquery.SchemaField("num_trades", "INTEGER"),
+]
+
+class BigQuerySession:
+    """
+    One BigQuery client per project and process, injected into every ETL step.
+    Also remembers which datasets and tables are known to exist, so repeated
+    runs in the same process skip the existence checks.
+    """
+    _sessions = {}
+    _lock = threading.Lock()
+
+    def __init__(self, project):
+        self.project = project
+        self.client = bigquery.Client(project=project)
+        self.existing = set()
+
+    @classmethod
+    def get(cls, project=GCP_PROJECT_ID):
+        """Return the shared session for a project, creating it on first use."""
+        with cls._lock:
+            if project not in cls._sessions:
+                cls._sessions[project] = cls(project)
+            return cls._sessions[project]
+
+def create_dataset_if_not_exists(bq, dataset_id):
     """
     Create a BigQuery dataset if it doesn't exist.
     dataset_id should be in the format "project_id.dataset_id"
     """
+    if dataset_id in bq.existing:
+        return
     try:
-        client.get_dataset(dataset_id)
+        bq.client.get_dataset(dataset_id)
         print(f"Dataset {dataset_id} already exists.")
     except NotFound:
         dataset = bigquery.Dataset(dataset_id)
         dataset.location = "US"  # Update as needed
-        dataset = client.create_dataset(dataset)
+        dataset = bq.client.create_dataset(dataset)
         print(f"Created dataset {dataset_id}.")
+    bq.existing.add(dataset_id)
 
-def create_table_if_not_exists(project, dataset, table):
+def create_table_if_not_exists(bq, dataset, table):
     """
     Create the BigQuery table if it doesn't exist.
     """
-    client = bigquery.Client(project=project)
-    table_id = f"{project}.{dataset}.{table}"
-    schema = [
-        bigquery.SchemaField("ticker", "STRING"),
-        bigquery.SchemaField("date", "TIMESTAMP"),
-        bigquery.SchemaField("open", "FLOAT"),
-        bigquery.SchemaField("high", "FLOAT"),
-        bigquery.SchemaField("low", "FLOAT"),
-        bigquery.SchemaField("close", "FLOAT"),
-        bigquery.SchemaField("volume", "INTEGER"),
-        bigquery.SchemaField("volume_weighted", "FLOAT"),
-        bigquery.SchemaField("num_trades", "INTEGER"),
-    ]
-    dataset_ref = client.dataset(dataset)
+    table_id = f"{bq.project}.{dataset}.{table}"
+    if table_id in bq.existing:
+        return
     try:
-        client.get_table(table_id)  # Check if table exists
+        bq.client.get_table(table_id)  # Check if table exists
         print(f"Table {table_id} already exists.")
     except NotFound:
-        table_obj = bigquery.Table(table_id, schema=schema)
-        table_obj = client.create_table(table_obj)
+        table_obj = bigquery.Table(table_id, schema=BQ_SCHEMA)
+        table_obj = bq.client.create_table(table_obj)
         print(f"Created table {table_id}.")
+    bq.existing.add(table_id)
 
-def load_to_bigquery(rows, project, dataset, table):
+#%%
+
+class BulkSink:
+    """
+    Buffers transformed rows as Arrow tables and loads them in chunks.
+    A chunk is flushed once it reaches `chunk_rows` rows or `chunk_bytes` bytes,
+    so memory stays bounded on long backfills. Subclasses implement `load_chunk`.
+    """
+    def __init__(self, chunk_rows=CHUNK_ROWS, chunk_bytes=CHUNK_BYTES, on_flush=None):
+        self.chunk_rows = chunk_rows
+        self.chunk_bytes = chunk_bytes
+        self.on_flush = on_flush  # Called with each chunk once it has landed
+        self.buffer = []
+        self.buffered_rows = 0
+        self.buffered_bytes = 0
+        self.rows_loaded = 0
+
+    def write(self, rows):
+        """
+        Add rows (an Arrow table or a list of dicts) to the current chunk,
+        flushing if a limit is reached.
+        """
+        table = rows if isinstance(rows, pa.Table) else rows_to_table(rows)
+        if table.num_rows == 0:
+            return
+        self.buffer.append(table)
+        self.buffered_rows += table.num_rows
+        self.buffered_bytes += table.nbytes
+        if self.buffered_rows >= self.chunk_rows or self.buffered_bytes >= self.chunk_bytes:
+            self.flush()
+
+    def flush(self):
+        """Load the buffered chunk."""
+        if not self.buffer:
+            return
+        table = pa.concat_tables(self.buffer)
+        self.buffer, self.buffered_rows, self.buffered_bytes = [], 0, 0
+        self.load_chunk(table)
+        self.rows_loaded += table.num_rows
+        if self.on_flush:
+            self.on_flush(table)
+
+    def load_chunk(self, table):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Don't load a partial chunk if the run failed
+        if exc_type is None:
+            self.close()
+
+class ParquetSink(BulkSink):
+    """
+    Writes each chunk as a Parquet file in a local directory.
+    Stands in for BigQuery when running locally or in tests.
+    """
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.part = len([f for f in os.listdir(directory) if f.endswith(".parquet")])
+
+    def load_chunk(self, table):
+        path = os.path.join(self.directory, f"part-{self.part:05d}.parquet")
+        pq.write_table(table, path)
+        self.part += 1
+        print(f"Wrote {table.num_rows} rows to {path}.")
+
+class BigQuerySink(BulkSink):
+    """
+    Loads each chunk into a staging table with a Parquet load job, then MERGEs it
+    into the target on (ticker, date). Re-loaded bars (retries, resumed or
+    overlapping backfills) update the existing row instead of adding a duplicate.
+    """
+    def __init__(self, bq, dataset, table, **kwargs):
+        super().__init__(**kwargs)
+        self.client = bq.client
+        self.table_id = f"{bq.project}.{dataset}.{table}"
+        self.job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            schema=BQ_SCHEMA,
+        )
+
+    def merge_query(self, staging_id):
+        columns = [field.name for field in BQ_SCHEMA]
+        updates = ", ".join(f"{c} = S.{c}" for c in columns if c not in ("ticker", "date"))
+        return f"""
+            MERGE `{self.table_id}` T
+            USING (
+                SELECT * FROM `{staging_id}`
+                WHERE TRUE
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY ticker, date) = 1
+            ) S
+            ON T.ticker = S.ticker AND T.date = S.date
+            WHEN MATCHED THEN UPDATE SET {updates}
+            WHEN NOT MATCHED THEN INSERT ({", ".join(columns)}) VALUES ({", ".join(f"S.{c}" for c in columns)})
+        """
+
+    def load_chunk(self, table):
+        # One staging table per chunk, so concurrent sinks never share one
+        staging_id = f"{self.table_id}_staging_{uuid.uuid4().hex[:12]}"
+        buffer = pa.BufferOutputStream()
+        pq.write_table(table, buffer)
+        try:
+            job = self.client.load_table_from_file(
+                pa.BufferReader(buffer.getvalue()), staging_id, job_config=self.job_config
+            )
+            job.result()  # Wait for the load job to finish
+            merge = self.client.query(self.merge_query(staging_id))
+            merge.result()
+        finally:
+            self.client.delete_table(staging_id, not_found_ok=True)
+        print(f"Merged {table.num_rows} rows into {self.table_id} "
+              f"({merge.num_dml_affected_rows} inserted or updated).")
+
+def rows_to_table(rows):
+    """Convert transformed rows into an Arrow table with the bar schema."""
+    arrays = []
+    for field in BAR_SCHEMA:
+        values = [row[field.name] for row in rows]
+        if field.name == "date":
+            # ISO 8601 strings, e.g. "2025-03-14T04:00:00Z"
+            arrays.append(pa.array(values, pa.string()).cast(field.type))
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.Table.from_arrays(arrays, schema=BAR_SCHEMA)
+
+def run_pipeline(source, sink, watermarks=None, queue_size=QUEUE_SIZE):
     """
-    Load the list of rows into a BigQuery table.
+    Streaming transform -> load stage fed by an extraction generator.
+    `source` yields (ticker, raw_data) (e.g. extract_all). Extraction threads,
+    this transform loop and a loader thread run concurrently, linked by bounded
+    queues, so a slow stage applies backpressure to the ones before it and
+    memory stays bounded whatever the ticker count.
     """
-    client = bigquery.Client(project=project)
-    table_id = f"{project}.{dataset}.{table}"
-    
-    errors = client.insert_rows_json(table_id, rows)
+    watermarks = watermarks or {}
+    load_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def loader():
+        try:
+            while (bars := load_queue.get()) is not None:
+                sink.write(bars)
+        except Exception as e:
+            errors.append(e)
+            # Keep draining so the transform loop never blocks on a dead loader
+            while load_queue.get() is not None:
+                pass
+
+    thread = threading.Thread(target=loader, daemon=True)
+    thread.start()
+    try:
+        for ticker, raw_data in source:
+            if errors:
+                break
+            bars = dedupe_table(transform_bars(ticker, raw_data), watermarks.get(ticker))
+            if bars.num_rows:
+                load_queue.put(bars)
+    finally:
+        load_queue.put(None)
+        thread.join()
     if errors:
-        print("Errors while inserting rows:", errors)
-    else:
-        print("Rows successfully inserted into BigQuery.")
+        raise errors[0]
+
+#%%
+
+class BackfillManifest:
+    """
+    Completed backfill work units, checkpointed to SQLite so an interrupted
+    backfill resumes where it stopped.
+    """
+    def __init__(self, path=WATERMARK_DB):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS backfill_units (unit_id TEXT PRIMARY KEY, completed_at TEXT NOT NULL)"
+            )
+
+    def completed(self):
+        """Return the ids of all completed units."""
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT unit_id FROM backfill_units")}
+
+    def mark_done(self, unit_ids):
+        """Record units as completed."""
+        now = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO backfill_units (unit_id, completed_at) VALUES (?, ?)",
+                [(unit_id, now) for unit_id in unit_ids],
+            )
+
+def plan_backfill(tickers, start, end, window_days=BACKFILL_WINDOW_DAYS, batch_size=SYMBOLS_PER_REQUEST):
+    """
+    Split a date range x ticker set into work units.
+    start and end are dates ("YYYY-MM-DD", inclusive). Each unit covers up to
+    `batch_size` tickers over up to `window_days` days, and its id is stable
+    across runs so completed units can be skipped on resume.
+    """
+    start = datetime.strptime(start, "%Y-%m-%d")
+    end = datetime.strptime(end, "%Y-%m-%d")
+    tickers = sorted(set(tickers))
+    batches = [tickers[i:i + batch_size] for i in range(0, len(tickers), batch_size)]
+
+    units = []
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + timedelta(days=window_days - 1), end)
+        start_date = window_start.strftime("%Y-%m-%dT00:00:00Z")
+        end_date = window_end.strftime("%Y-%m-%dT23:59:59Z")
+        for batch in batches:
+            digest = hashlib.md5(",".join(batch).encode()).hexdigest()[:12]
+            units.append({
+                "unit_id": f"{start_date}|{end_date}|{digest}",
+                "tickers": batch,
+                "start_date": start_date,
+                "end_date": end_date,
+            })
+        window_start = window_end + timedelta(days=1)
+    return units
+
+def run_backfill_unit(unit, session, rate_limiter):
+    """Extract and transform one work unit into a bar table."""
+    bars = extract_stock_bars_batch(unit["tickers"], unit["start_date"], unit["end_date"], session, rate_limiter)
+    tables = [transform_bars(ticker, {"bars": ticker_bars}) for ticker, ticker_bars in bars.items()]
+    return pa.concat_tables(tables) if tables else BAR_SCHEMA.empty_table()
+
+def backfill(tickers, start, end, headers, sink, manifest=None, window_days=BACKFILL_WINDOW_DAYS,
+             max_workers=MAX_WORKERS, watermark_store=None):
+    """
+    Load historical bars for a date range, resumably.
+      1. Plan: split the range x tickers into work units, skipping completed ones.
+      2. Run: extract/transform units across a thread pool (the work is I/O bound),
+         keeping at most 2 x max_workers units in flight.
+      3. Load: write results to the sink; units are checkpointed in the manifest
+         only once the chunk holding their rows has been loaded.
+    """
+    manifest = manifest or BackfillManifest()
+    completed = manifest.completed()
+    todo = [unit for unit in plan_backfill(tickers, start, end, window_days) if unit["unit_id"] not in completed]
+    print(f"Backfill {start} to {end}: {len(todo)} work units to run, {len(completed)} already done.")
+
+    session = create_session(headers, pool_size=max_workers)
+    rate_limiter = RateLimiter(REQUESTS_PER_MINUTE / 60)
+
+    # Units whose rows are buffered in the sink but not yet loaded
+    pending = []
 
-def run_etl(tickers, headers):
+    def on_flush(table):
+        manifest.mark_done(pending)
+        pending.clear()
+        if watermark_store:
+            watermark_store.update_table(table)
+
+    sink.on_flush = on_flush
+    failed = 0
+    units = iter(todo)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, sink:
+        in_flight = {}
+
+        def submit_next():
+            unit = next(units, None)
+            if unit:
+                in_flight[executor.submit(run_backfill_unit, unit, session, rate_limiter)] = unit
+
+        for _ in range(2 * max_workers):
+            submit_next()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                unit = in_flight.pop(future)
+                try:
+                    table = future.result()
+                except Exception as e:
+                    print(f"Error in unit {unit['unit_id']}: {e}")
+                    failed += 1
+                else:
+                    pending.append(unit["unit_id"])
+                    sink.write(table)
+                submit_next()
+
+    # Units that returned no rows never reach a flush
+    manifest.mark_done(pending)
+    session.close()
+    print(f"Backfill finished: {sink.rows_loaded} rows loaded, {failed} units failed (re-run to retry).")
+
+def run_etl(tickers, headers, lookback_days=90, watermark_store=None, sink=None, bq=None):
     """
     Run the ETL process:
-      1. Extract: Retrieve daily stock prices for the past 90 days.
-      2. Transform: Format data for BigQuery.
-      3. Load: Insert rows into BigQuery.
+      1. Extract: Retrieve daily stock prices for the past 90 days (concurrently).
+         With a watermark store, only bars newer than each ticker's watermark.
+      2. Transform: Format data for BigQuery and drop already-loaded bars.
+      3. Load: Bulk load rows in chunks (BigQuery by default) and advance the watermarks.
+    The steps run as a streaming pipeline (see run_pipeline). Watermarks advance
+    after every loaded chunk of STREAM_CHUNK_ROWS rows, so a crash only loses the
+    chunk in flight.
     """
-    # Calculate date range for past 90 days (UTC)
+    # Calculate default date range for past 90 days (UTC)
     today = datetime.utcnow()
-    start_date = (today - timedelta(days=90)).strftime("%Y-%m-%dT00:00:00Z")
+    default_start = (today - timedelta(days=lookback_days)).strftime("%Y-%m-%dT00:00:00Z")
     end_date = today.strftime("%Y-%m-%dT00:00:00Z")
 
-    all_rows = []
+    # Group tickers by start date so incremental runs still batch symbols
+    watermarks = watermark_store.get_all(tickers) if watermark_store else {}
+    starts = {}
     for ticker in tickers:
-        print(f"Processing {ticker} from {start_date} to {end_date}...")
-        raw_data = extract_daily_stock_prices(ticker, start_date, end_date, headers)
-        if raw_data:
-            rows = transform_data(ticker, raw_data)
-            all_rows.extend(rows)
-        time.sleep(1)  # Pause to respect API rate limits
-
-    # Initialize BigQuery client
-    bq_client = bigquery.Client(project=GCP_PROJECT_ID)
-    dataset_id = f"{GCP_PROJECT_ID}.{GCP_BQ_DATASET}"
-    # Create dataset if it doesn't exist
-    create_dataset_if_not_exists(bq_client, dataset_id)
-    # Create table if it does not exist
-    create_table_if_not_exists(GCP_PROJECT_ID, GCP_BQ_DATASET, GCP_BQ_TABLE)
-    # Load transformed rows into BigQuery
-    load_to_bigquery(all_rows, GCP_PROJECT_ID, GCP_BQ_DATASET, GCP_BQ_TABLE)
+        starts.setdefault(watermarks.get(ticker, default_start), []).append(ticker)
+
+    if sink is None:
+        # Reuse the process-wide BigQuery session
+        bq = bq or BigQuerySession.get(GCP_PROJECT_ID)
+        dataset_id = f"{bq.project}.{GCP_BQ_DATASET}"
+        # Create dataset if it doesn't exist
+        create_dataset_if_not_exists(bq, dataset_id)
+        # Create table if it does not exist
+        create_table_if_not_exists(bq, GCP_BQ_DATASET, GCP_BQ_TABLE)
+        sink = BigQuerySink(bq, GCP_BQ_DATASET, GCP_BQ_TABLE, chunk_rows=STREAM_CHUNK_ROWS)
+
+    # Only advance watermarks once the rows have landed
+    if watermark_store:
+        sink.on_flush = watermark_store.update_table
+
+    with sink:
+        for start_date, group in starts.items():
+            print(f"Processing {len(group)} tickers from {start_date} to {end_date}...")
+            source = extract_all(group, start_date, end_date, headers)
+            run_pipeline(source, sink, watermarks)
+    print(f"{sink.rows_loaded} rows loaded.")
 
 def main():
-    tickers = ["AAPL", "MSFT", "GOOGL", "AMZN", "NVDA", "TSLA", "META"]
+    """
+    Usage:
+      python etl.py                                   # Incremental daily run
+      python etl.py backfill --start 2015-01-01 --end 2024-12-31 [--parquet-dir ./bars]
+    """
+    parser = argparse.ArgumentParser(description="Stock bars ETL")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "backfill"])
+    parser.add_argument("--tickers", default="AAPL,MSFT,GOOGL,AMZN,NVDA,TSLA,META",
+                        help="Comma-separated tickers")
+    parser.add_argument("--start", help="Backfill start date (YYYY-MM-DD)")
+    parser.add_argument("--end", default=datetime.utcnow().strftime("%Y-%m-%d"),
+                        help="Backfill end date (YYYY-MM-DD)")
+    parser.add_argument("--window-days", type=int, default=BACKFILL_WINDOW_DAYS)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--parquet-dir", help="Write to a local Parquet directory instead of BigQuery")
+    args = parser.parse_args()
+
+    tickers = args.tickers.split(",")
     headers = set_headers(ALPACA_API_KEY, ALPACA_SECRET_KEY)
-    run_etl(tickers, headers)
+
+    if args.command == "run":
+        sink = ParquetSink(args.parquet_dir, chunk_rows=STREAM_CHUNK_ROWS) if args.parquet_dir else None
+        run_etl(tickers, headers, watermark_store=WatermarkStore(), sink=sink)
+        return
+
+    if not args.start:
+        parser.error("backfill requires --start")
+    if args.parquet_dir:
+        sink = ParquetSink(args.parquet_dir)
+    else:
+        bq = BigQuerySession.get(GCP_PROJECT_ID)
+        create_dataset_if_not_exists(bq, f"{bq.project}.{GCP_BQ_DATASET}")
+        create_table_if_not_exists(bq, GCP_BQ_DATASET, GCP_BQ_TABLE)
+        sink = BigQuerySink(bq, GCP_BQ_DATASET, GCP_BQ_TABLE)
+    backfill(tickers, args.start, args.end, headers, sink, window_days=args.window_days,
+             max_workers=args.workers, watermark_store=WatermarkStore())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
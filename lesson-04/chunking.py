@@ -0,0 +1,90 @@
+"""
+Token-aware chunking of news articles before embedding.
+
+multi-qa-mpnet-base-dot-v1 truncates its input (512 tokens), so long articles
+are split into overlapping, sentence-aligned chunks that each fit the model.
+Every chunk keeps the article fields plus metadata linking it to its parent.
+"""
+import re
+from qdrant_util import article_key
+
+# Chunk size and overlap, in model tokens
+MAX_TOKENS = 256
+OVERLAP_TOKENS = 48
+
+# Sentence ends (., !, ?) followed by whitespace, or paragraph breaks
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n{2,}')
+
+def split_sentences(text):
+    """Split text into sentences and paragraphs."""
+    return [sentence.strip() for sentence in SENTENCE_RE.split(text) if sentence.strip()]
+
+def count_tokens(sentences, tokenizer=None):
+    """Token count per sentence, using the model tokenizer when given."""
+    if tokenizer is None:
+        # Rough estimate: ~1.3 word-piece tokens per word
+        return [int(len(sentence.split()) * 1.3) + 1 for sentence in sentences]
+    encoded = tokenizer(sentences, add_special_tokens=False)['input_ids']
+    return [len(ids) for ids in encoded]
+
+def split_long_sentence(sentence, n_tokens, max_tokens):
+    """Split a sentence longer than max_tokens into word windows."""
+    words = sentence.split()
+    n_parts = -(-n_tokens // max_tokens)  # Ceiling division
+    size = -(-len(words) // n_parts)
+    parts = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+    return [(part, -(-n_tokens // n_parts)) for part in parts]
+
+def chunk_text(text, tokenizer=None, max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """
+    Split text into chunks of at most max_tokens tokens, on sentence boundaries.
+    Consecutive chunks share up to overlap_tokens tokens of trailing sentences.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+
+    pieces = []
+    for sentence, n_tokens in zip(sentences, count_tokens(sentences, tokenizer)):
+        if n_tokens > max_tokens:
+            pieces.extend(split_long_sentence(sentence, n_tokens, max_tokens))
+        else:
+            pieces.append((sentence, n_tokens))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for piece, n_tokens in pieces:
+        if current and current_tokens + n_tokens > max_tokens:
+            chunks.append(" ".join(p for p, _ in current))
+            # Carry trailing sentences over as overlap
+            overlap, overlap_count = [], 0
+            for p, n in reversed(current):
+                if overlap_count + n > overlap_tokens or overlap_count + n + n_tokens > max_tokens:
+                    break
+                overlap.insert(0, (p, n))
+                overlap_count += n
+            current, current_tokens = overlap, overlap_count
+        current.append((piece, n_tokens))
+        current_tokens += n_tokens
+    chunks.append(" ".join(p for p, _ in current))
+    return chunks
+
+def chunk_articles(articles, tokenizer=None, max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """
+    Split transformed articles into chunks ready for embedding.
+    Each chunk is a copy of its article with `content` replaced by the chunk
+    text, plus `parent_id`, `chunk_index` and `chunk_count`.
+    """
+    chunked = []
+    for article in articles:
+        chunks = chunk_text(article.get('content', ''), tokenizer, max_tokens, overlap_tokens) or ['']
+        parent_id = article_key(article)
+        for index, chunk in enumerate(chunks):
+            chunked.append({
+                **article,
+                'content': chunk,
+                'parent_id': parent_id,
+                'chunk_index': index,
+                'chunk_count': len(chunks),
+            })
+    return chunked
@@ -0,0 +1,106 @@
+"""
+HTML cleaning for news article content.
+
+Uses selectolax when it is installed (much faster than BeautifulSoup),
+otherwise BeautifulSoup with lxml or the built-in html.parser.
+
+```
+uv add selectolax
+```
+"""
+import re
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml  # noqa: F401
+    BS_PARSER = 'lxml'
+except ImportError:
+    BS_PARSER = 'html.parser'
+
+# Elements removed together with their content
+REMOVED_TAGS = ['script', 'style', 'iframe', 'figure', 'img']
+
+# Common disclaimers and boilerplate text; any line containing one is dropped
+DISCLAIMERS = [
+    "Image via Shutterstock",
+    "Disclaimer:",
+    "This content was partially produced with the help of AI tools",
+    "Read More:",
+    "See Also:",
+    "Read Next:"
+]
+
+# Precompiled patterns, so cleaning does no regex compilation per article
+BLANK_LINES_RE = re.compile(r'\n\s*\n')
+SPACES_RE = re.compile(r' +')
+ENTITY_RE = re.compile(r'&[a-zA-Z0-9]+;')
+DISCLAIMER_RE = re.compile(".*(?:" + "|".join(re.escape(d) for d in DISCLAIMERS) + ").*\n?")
+EXTRA_BREAKS_RE = re.compile(r'\n{3,}')
+
+# Below this many articles a process pool costs more than it saves
+MIN_PARALLEL_BATCH = 32
+
+def html_to_text(content):
+    """Extract the text of an HTML fragment, dropping REMOVED_TAGS."""
+    if HTMLParser is not None:
+        tree = HTMLParser(content)
+        tree.strip_tags(REMOVED_TAGS)
+        root = tree.body or tree.root
+        return root.text(separator='') if root else ''
+
+    soup = BeautifulSoup(content, BS_PARSER)
+    for element in soup(REMOVED_TAGS):
+        element.decompose()
+    return soup.get_text()
+
+def clean_text(content):
+    """Clean and transform article content."""
+    if not content:
+        return ''
+
+    # Extract text from the HTML
+    text = html_to_text(content)
+
+    # Replace non-breaking spaces with regular spaces
+    text = text.replace('\xa0', ' ')
+
+    # Remove extra whitespace and newlines
+    text = BLANK_LINES_RE.sub('\n\n', text)  # Replace multiple newlines with double newlines
+    text = SPACES_RE.sub(' ', text)  # Replace multiple spaces with single space
+
+    # Remove special HTML entities like &nbsp;
+    text = ENTITY_RE.sub(' ', text)
+
+    # Remove common disclaimers and boilerplate text in a single pass
+    text = DISCLAIMER_RE.sub('', text)
+
+    # Normalize double spacing and paragraph breaks
+    text = EXTRA_BREAKS_RE.sub('\n\n', text)  # No more than double line breaks
+
+    return text.strip()
+
+def clean_texts(contents, executor=None, chunksize=16):
+    """
+    Clean many articles at once.
+    Pass a ProcessPoolExecutor (see create_cleaning_pool) to spread large
+    batches across cores; small batches are cleaned in-process.
+    """
+    if executor is None or len(contents) < MIN_PARALLEL_BATCH:
+        return [clean_text(content) for content in contents]
+    return list(executor.map(clean_text, contents, chunksize=chunksize))
+
+def create_cleaning_pool(workers=None):
+    """Create a process pool for clean_texts."""
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn"),  # Forking a threaded process can deadlock
+    )
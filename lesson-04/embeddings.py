@@ -1,32 +1,321 @@
+"""
+Embedding model with an on-disk cache, length-bucketed batching and a
+choice of inference backend:
+
+- "torch": full-precision PyTorch (default)
+- "onnx": ONNX Runtime export of the same model
+- "onnx-int8": dynamically int8-quantized ONNX model, the smallest and
+  fastest option on CPU-only nodes
+
+The ONNX backends need the extra:
+```
+uv add "sentence-transformers[onnx]"
+```
+"""
 import os
+import hashlib
+import sqlite3
+import threading
+import multiprocessing
+from contextlib import contextmanager
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import torch
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from tqdm.auto import tqdm
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
 from langchain_core.embeddings import Embeddings
 
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Target instruction set for int8 quantization: "avx2", "avx512", "avx512_vnni" or "arm64"
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx2")
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by content hash + model name.
+
+    Vectors live in a memory-mapped float32 matrix with `max_entries` rows.
+    A SQLite index maps keys to rows and tracks when each row was last used,
+    so the least recently used rows are overwritten once the cache is full.
+    Several processes may share one cache directory: rows are handed out
+    inside SQLite write transactions, never from per-process counters.
+    """
+    def __init__(self, cache_dir, dim, max_entries=100_000):
+        """
+        :param cache_dir: Directory holding the vector file and index.
+        :param dim: Embedding dimension.
+        :param max_entries: Maximum number of cached vectors.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.dim = dim
+        self.max_entries = max_entries
+        name = f"{dim}x{max_entries}"
+        vectors_path = os.path.join(cache_dir, f"vectors_{name}.f32")
+        mode = "r+" if os.path.exists(vectors_path) else "w+"
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode=mode, shape=(max_entries, dim))
+
+        self.lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(
+            os.path.join(cache_dir, f"index_{name}.db"), timeout=60, isolation_level=None, check_same_thread=False
+        )
+        # last_used = 0 marks a reserved row whose vector is still being written
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    @staticmethod
+    def make_key(model_name, text):
+        """Cache key for a text encoded by a given model."""
+        return hashlib.sha1(f"{model_name}\0{text}".encode()).hexdigest()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE serializes writers across processes."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _tick(self):
+        """Next value of the shared LRU clock (inside a transaction)."""
+        return self.conn.execute("SELECT COALESCE(MAX(last_used), 0) + 1 FROM entries").fetchone()[0]
+
+    def _slots(self, keys, include_reserved=False):
+        """Return {key: slot} for the keys in the index."""
+        slots = {}
+        condition = "" if include_reserved else " AND last_used > 0"
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            slots.update(self.conn.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({placeholders}){condition}", chunk
+            ).fetchall())
+        return slots
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys that are cached."""
+        # Vectors are copied before the transaction ends, so no writer can reuse their rows meanwhile
+        with self.lock, self._transaction():
+            found = self._slots(keys)
+            if found:
+                clock = self._tick()
+                self.conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    [(clock, key) for key in found],
+                )
+            return {key: np.array(self.vectors[slot]) for key, slot in found.items()}
+
+    def put_many(self, keys, vectors):
+        """Cache vectors, evicting the least recently used entries when full."""
+        with self.lock:
+            # Reserve rows: free ones first, then the least recently used ones
+            with self._transaction():
+                # Skip keys another thread or process cached (or is caching) in the meantime
+                existing = self._slots(keys, include_reserved=True)
+                new = [(key, vector) for key, vector in zip(keys, vectors) if key not in existing]
+                new = new[-self.max_entries:]
+
+                next_slot = self.conn.execute("SELECT COALESCE(MAX(slot), -1) + 1 FROM entries").fetchone()[0]
+                n_free = min(len(new), max(0, self.max_entries - next_slot))
+                slots = list(range(next_slot, next_slot + n_free))
+                n_evict = len(new) - n_free
+                if n_evict:
+                    evicted = self.conn.execute(
+                        "SELECT key, slot FROM entries WHERE last_used > 0 ORDER BY last_used LIMIT ?", (n_evict,)
+                    ).fetchall()
+                    self.conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                    slots.extend(slot for _, slot in evicted)
+                new = new[:len(slots)]
+                self.conn.executemany(
+                    "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, 0)",
+                    [(key, slot) for slot, (key, _) in zip(slots, new)],
+                )
+
+            # Write the vectors, then make the rows visible
+            for slot, (_, vector) in zip(slots, new):
+                self.vectors[slot] = vector
+            self.vectors.flush()
+            with self._transaction():
+                clock = self._tick()
+                self.conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ? AND slot = ?",
+                    [(clock, key, slot) for slot, (key, _) in zip(slots, new)],
+                )
+
 class EmbeddingModel(Embeddings):
     def __init__(
         self,
         local_model_path: str = "./models/multi-qa-mpnet-base-dot-v1",
         remote_model_name: str = "multi-qa-mpnet-base-dot-v1",
+        cache_dir: str = os.getenv("EMBEDDING_CACHE_DIR", "./models/embedding-cache"),
+        cache_size: int = 100_000,
+        batch_size: int = 64,
+        max_batch_tokens: int = 8192,
+        backend: str = os.getenv("EMBEDDING_BACKEND", "torch"),
     ):
         """
         :param local_model_path: Where to look for (and possibly save) the model.
         :param remote_model_name: Name of the model on Hugging Face.
+        :param cache_dir: Where to keep the embedding cache (None disables it).
+        :param cache_size: Maximum number of cached embeddings.
+        :param batch_size: Maximum number of texts per forward pass.
+        :param max_batch_tokens: Maximum padded tokens (texts x longest text) per forward pass.
+        :param backend: Inference backend, one of BACKENDS.
         """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        self.local_model_path = local_model_path
+        self.backend = backend
+        self.model = self._load_model(local_model_path, remote_model_name, backend)
+
+        # Quantized vectors differ slightly, so they are cached separately
+        self.model_name = remote_model_name if backend == "torch" else f"{remote_model_name}:{backend}"
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.cache = None
+        if cache_dir:
+            dim = self.model.get_sentence_embedding_dimension()
+            self.cache = EmbeddingCache(cache_dir, dim, cache_size)
+
+    @staticmethod
+    def _load_model(local_model_path, remote_model_name, backend):
+        """Load the model for a backend, exporting/quantizing to ONNX on first use."""
+        onnx_backend = "torch" if backend == "torch" else "onnx"
+        needs_save = not os.path.isdir(local_model_path) or (
+            onnx_backend == "onnx" and not os.path.exists(os.path.join(local_model_path, "onnx", "model.onnx"))
+        )
         # Check if the local path exists
         if os.path.isdir(local_model_path):
-            # If it exists, load from local
-            print(f"Loading model from local path: {local_model_path}")
-            self.model = SentenceTransformer(local_model_path)
+            # If it exists, load from local (exports to ONNX if not there yet)
+            print(f"Loading model from local path: {local_model_path} ({backend})")
+            model = SentenceTransformer(local_model_path, backend=onnx_backend)
         else:
             # Otherwise, download from remote and then save to local
             print(f"Local model not found. Downloading '{remote_model_name}'...")
-            self.model = SentenceTransformer(remote_model_name)
-            # Create parent directories if needed, then save the model
+            model = SentenceTransformer(remote_model_name, backend=onnx_backend)
+        # Create parent directories if needed, then save the model (and its ONNX export)
+        if needs_save:
             os.makedirs(local_model_path, exist_ok=True)
-            self.model.save(local_model_path)
+            model.save(local_model_path)
             print(f"Model saved locally to: {local_model_path}")
 
+        if backend != "onnx-int8":
+            return model
+
+        # Quantize once, then load the int8 model file
+        file_name = f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+        if not os.path.exists(os.path.join(local_model_path, file_name)):
+            print(f"Quantizing ONNX model to int8 ({ONNX_QUANTIZATION})...")
+            export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, local_model_path)
+        return SentenceTransformer(local_model_path, backend="onnx", model_kwargs={"file_name": file_name})
+
+    def check_parity(self, texts, min_cosine=0.99):
+        """
+        Compare this backend's embeddings with the full-precision PyTorch model.
+
+        :param texts: Sample texts to embed with both models
+        :param min_cosine: Lowest acceptable cosine similarity per text
+        :return: Dict with min/mean cosine similarity and whether the check passed
+        """
+        reference = SentenceTransformer(self.local_model_path, backend="torch")
+        expected = reference.encode(texts, convert_to_numpy=True)
+        actual = self.model.encode(texts, convert_to_numpy=True)
+        cosine = np.sum(expected * actual, axis=1) / (
+            np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+        )
+        result = {
+            "backend": self.backend,
+            "min_cosine": float(cosine.min()),
+            "mean_cosine": float(cosine.mean()),
+            "passed": bool(cosine.min() >= min_cosine),
+        }
+        print(f"Parity vs torch: {result}")
+        return result
+
+    def _token_lengths(self, texts):
+        """Token count of each text, capped at the model's max sequence length."""
+        max_length = self.model.max_seq_length
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [min(len(text.split()) * 2, max_length) for text in texts]
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _encode_batched(self, texts, show_progress_bar=False):
+        """
+        Encode texts in length-bucketed batches.
+        Texts are sorted by token length and grouped so each batch stays under
+        `max_batch_tokens` padded tokens, so short headlines run in large
+        batches and long articles in small ones without padding to each other.
+        Results are returned in the original order.
+        """
+        dim = self.model.get_sentence_embedding_dimension()
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+        if not texts:
+            return embeddings
+
+        lengths = self._token_lengths(texts)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        batches, batch = [], []
+        for i in order:
+            # Sorted ascending, so the newest text is the longest in the batch
+            if batch and ((len(batch) + 1) * lengths[i] > self.max_batch_tokens or len(batch) >= self.batch_size):
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        batches.append(batch)
+
+        for batch in tqdm(batches, desc="Batches", disable=not show_progress_bar):
+            vectors = self.model.encode([texts[i] for i in batch], batch_size=len(batch), show_progress_bar=False)
+            embeddings[batch] = vectors
+        return embeddings
+
+    def _encode(self, texts, show_progress_bar=False):
+        """
+        Encode texts into a float32 matrix, serving cached vectors where
+        possible and only running the model on texts not seen before.
+        """
+        if self.cache is None:
+            return self._encode_batched(texts, show_progress_bar)
+
+        lookup = self.cache_lookup(texts)
+        missing = lookup[2]
+        vectors = self._encode_batched(list(missing.values()), show_progress_bar) if missing else None
+        return self.cache_merge(lookup, vectors)
+
+    def cache_lookup(self, texts):
+        """
+        Look texts up in the cache. Returns (keys, found, missing): the key of
+        every text, {key: vector} of cached ones and {key: text} of the rest.
+        Encode the missing texts (e.g. in an EmbeddingWorkerPool) and pass
+        the vectors to `cache_merge`.
+        """
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(list(set(keys))) if self.cache is not None else {}
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        return keys, found, missing
+
+    def cache_merge(self, lookup, vectors):
+        """
+        Cache the vectors of the missing texts of a `cache_lookup` and return
+        the embeddings of all its texts, in order, as a float32 matrix.
+        """
+        keys, found, missing = lookup
+        if missing:
+            if self.cache is not None:
+                self.cache.put_many(list(missing), vectors)
+            found = {**found, **dict(zip(missing, vectors))}
+        if not keys:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+
     def embed_documents(self, texts):
         """
         Embed a list of documents.
@@ -34,7 +323,7 @@ class EmbeddingModel(Embeddings):
         :param texts: List of texts to embed
         :return: List of embeddings
         """
-        return self.model.encode(texts, show_progress_bar=False).tolist()
+        return self._encode(texts).tolist()
 
     def embed_query(self, text):
         """
@@ -43,8 +332,91 @@ class EmbeddingModel(Embeddings):
         :param text: Text to embed
         :return: Embedding for the text
         """
-        return self.model.encode(text).tolist()
+        return self._encode([text])[0].tolist()
 
     # Optional: Keep your original method if needed
     def encode_texts(self, texts):
-        return self.model.encode(texts, show_progress_bar=True)
+        return self._encode(texts, show_progress_bar=True)
+
+# ------------------------------------------------------------------------------
+# Multi-process embedding pool for bulk ingestion
+# ------------------------------------------------------------------------------
+
+# Model loaded once per worker process
+_worker_model = None
+
+def _init_worker(model_kwargs, threads_per_worker):
+    global _worker_model
+    torch.set_num_threads(threads_per_worker)
+    # The parent process owns the cache
+    _worker_model = EmbeddingModel(cache_dir=None, **model_kwargs)
+
+def _worker_dimension():
+    return _worker_model.model.get_sentence_embedding_dimension()
+
+def _encode_into_shared_memory(texts, shm_name):
+    vectors = _worker_model._encode_batched(texts)
+    shm = SharedMemory(name=shm_name)
+    try:
+        np.ndarray(vectors.shape, dtype=np.float32, buffer=shm.buf)[:] = vectors
+    finally:
+        shm.close()
+    return vectors.shape
+
+class EmbeddingWorkerPool:
+    """
+    Pool of worker processes, each holding its own EmbeddingModel, so bulk
+    embedding scales with cores instead of one interpreter.
+    Results are written into shared-memory buffers rather than pickled back.
+    """
+    def __init__(self, workers=None, threads_per_worker=1, **model_kwargs):
+        """
+        :param workers: Number of worker processes (default: cores / threads_per_worker).
+        :param threads_per_worker: Torch intra-op threads per worker.
+        :param model_kwargs: Arguments for each worker's EmbeddingModel.
+        """
+        workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),  # Forking after torch init can deadlock
+            initializer=_init_worker,
+            initargs=(model_kwargs, threads_per_worker),
+        )
+        self.workers = workers
+        self.dim = self.executor.submit(_worker_dimension).result()
+
+    def submit(self, texts):
+        """
+        Embed texts in a worker process.
+
+        :param texts: List of texts to embed
+        :return: Future resolving to a float32 matrix of embeddings
+        """
+        result = Future()
+        if not texts:
+            result.set_result(np.empty((0, self.dim), dtype=np.float32))
+            return result
+
+        shm = SharedMemory(create=True, size=len(texts) * self.dim * 4)
+
+        def done(future):
+            try:
+                shape = future.result()
+                result.set_result(np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy())
+            except Exception as e:
+                result.set_exception(e)
+            finally:
+                shm.close()
+                shm.unlink()
+
+        self.executor.submit(_encode_into_shared_memory, texts, shm.name).add_done_callback(done)
+        return result
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
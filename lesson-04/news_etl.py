@@ -1,22 +1,36 @@
 import os
-import re
 import json
 import time
+import threading
 import requests
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Add the project root to the Python path
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
-from embeddings import EmbeddingModel
-from qdrant import qdrant_client
-from qdrant_util import create_collection, upsert_points, search
+# embeddings (torch) and qdrant (client connection) are imported where they are
+# used: spawned cleaning workers re-import this module and need neither
+from qdrant_util import (
+    create_collection, create_payload_indexes, has_sparse_vectors, news_payload_to_article, reindex_collection,
+    resolve_alias, upsert_points, search, SeenIndex,
+)
+from cleaning import clean_texts, create_cleaning_pool
+from chunking import chunk_articles
 
 load_dotenv()
 
-BASE_URL = "https://data.alpaca.markets/v1beta1/news"
+BASE_URL = os.getenv("ALPACA_NEWS_URL", "https://data.alpaca.markets/v1beta1/news")
+
+# Extraction settings
+REQUESTS_PER_MINUTE = 200    # Alpaca basic plan limit
+SYMBOLS_PER_REQUEST = 50     # Tickers per request
+PAGE_LIMIT = 50              # Max articles per page
+MAX_WORKERS = 4              # Concurrent extraction threads
 
 def set_headers(api_key, secret_key):
     """Set the headers for the API request."""
@@ -26,82 +40,131 @@ def set_headers(api_key, secret_key):
         "APCA-API-SECRET-KEY": secret_key
     }
 
-def clean_text(content):
-    """Clean and transform article content."""
-    
-    # Parse HTML using BeautifulSoup
-    soup = BeautifulSoup(content, 'html.parser')
-    
-    # Remove all script, style, and iframe elements
-    for script_or_style in soup(['script', 'style', 'iframe']):
-        script_or_style.decompose()
-    
-    # Remove all figures and images
-    for figure in soup.find_all(['figure', 'img']):
-        figure.decompose()
-    
-    # Extract text from remaining HTML
-    text = soup.get_text()
-    
-    # Replace non-breaking spaces with regular spaces
-    text = text.replace('\xa0', ' ')
+class RateLimiter:
+    """Token bucket rate limiter shared by all extraction threads."""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
 
-    # Remove extra whitespace and newlines
-    text = re.sub(r'\n\s*\n', '\n\n', text)  # Replace multiple newlines with double newlines
-    text = re.sub(r' +', ' ', text)  # Replace multiple spaces with single space
-    
-    # Remove special HTML entities
-    text = re.sub(r'&[a-zA-Z0-9]+;', ' ', text)  # Remove HTML entities like &nbsp;
-    
-    # Remove common disclaimers and boilerplate text
-    disclaimers = [
-        "Image via Shutterstock",
-        "Disclaimer:",
-        "This content was partially produced with the help of AI tools",
-        "Read More:",
-        "See Also:",
-        "Read Next:"
-    ]
-    
-    for disclaimer in disclaimers:
-        text = re.sub(f".*{re.escape(disclaimer)}.*\n?", "", text)
-    
-    # Normalize double spacing and paragraph breaks
-    text = re.sub(r'\n{3,}', '\n\n', text)  # No more than double line breaks    
-    
-    return text.strip()
-
-def extract(ticker, headers, date_range):
-    """Extract news articles for a given ticker and date range."""
-    url = (
-        f"{BASE_URL}?sort=desc"
-        f"&start={date_range[0]}"
-        f"&end={date_range[1]}"
-        f"&symbols={ticker}"
-        "&include_content=true"
-        "&limit=3"
-    )
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
-    response = requests.get(url, headers=headers)
-    
-    # Parse the JSON response
-    if response.status_code == 200:
-        return response.json()
-    else:            
-        print(f"Error: {response.status_code} - {response.text}")
-        return None
-
-def transform(ticker, data):
-    """Transform the extracted data into a structured format."""
+def create_session(headers, pool_size=MAX_WORKERS):
+    """Create a pooled HTTP session with retries on rate limits and server errors."""
+    session = requests.Session()
+    session.headers.update(headers)
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def extract(tickers, headers, date_range, session=None, rate_limiter=None):
+    """
+    Extract news articles for one or more tickers over a whole date range.
+    Follows next_page_token until every article in the range is fetched.
+    """
+    if isinstance(tickers, str):
+        tickers = [tickers]
+    session = session or create_session(headers, pool_size=1)
+    params = {
+        "sort": "desc",
+        "start": date_range[0],
+        "end": date_range[1],
+        "symbols": ",".join(tickers),
+        "include_content": "true",
+        "limit": PAGE_LIMIT,
+    }
+
+    articles = []
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire()
+        response = session.get(BASE_URL, params=params)
+
+        # Parse the JSON response
+        if response.status_code != 200:
+            print(f"Error: {response.status_code} - {response.text}")
+            return None
+        page = response.json()
+        articles.extend(page.get('news') or [])
+        if not page.get('next_page_token'):
+            return {'news': articles, 'next_page_token': None}
+        params["page_token"] = page['next_page_token']
+
+def extract_all(tickers, headers, date_range, batch_size=SYMBOLS_PER_REQUEST, max_workers=MAX_WORKERS,
+                failures=None):
+    """
+    Extract news for many tickers concurrently, batching symbols per request.
+    Requests share one pooled session and one rate limiter.
+    Yields (batch, data) as each batch finishes; batches that failed are
+    appended to `failures` when given.
+    """
+    session = create_session(headers, pool_size=max_workers)
+    rate_limiter = RateLimiter(REQUESTS_PER_MINUTE / 60)
+    batches = [tickers[i:i + batch_size] for i in range(0, len(tickers), batch_size)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(extract, batch, headers, date_range, session, rate_limiter): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"Error fetching news for {batch[0]}..{batch[-1]}: {e}")
+                data = None
+            if data is None:
+                if failures is not None:
+                    failures.append(batch)
+                continue
+            yield batch, data
+    session.close()
+
+def transform(tickers, data, seen=None, executor=None):
+    """
+    Transform the extracted data into a structured format.
+    Each article keeps all the symbols Alpaca tagged it with; `ticker` is the
+    first of them among `tickers`. Pass the whole requested ticker list, not
+    just the batch the article was fetched for: an article is stored once,
+    from whichever batch sees it first. Articles already in the `seen` index
+    are dropped before cleaning. Content is cleaned in one batch, across
+    `executor`'s processes when given.
+    """
+    if isinstance(tickers, str):
+        tickers = [tickers]
     store = [] 
     articles = data.get('news', [])
+    if seen:
+        articles = seen.filter_new(articles)
+
+    # Clean content
+    contents = clean_texts([article.get('content', '') for article in articles], executor)
     
-    for article in articles:
-        # Clean content
-        content = clean_text(article.get('content', ''))
+    requested = set(tickers)
+    for article, content in zip(articles, contents):
+        symbols = article.get('symbols') or []
+        tagged = [symbol for symbol in symbols if symbol in requested]
         # Store the transformed article
         store.append({  
-            'ticker': ticker,
+            'id': article.get('id'),
+            'ticker': tagged[0] if tagged else (symbols[0] if symbols else None),
+            'symbols': symbols,
             'created_at': article.get('created_at', ''),
             'updated_at': article.get('updated_at', ''),
             'headline': article.get('headline', ''),
@@ -110,46 +173,195 @@ def transform(ticker, data):
         })
     return store
 
-def load(embedding_model, articles, collection):
-    """Load the transformed articles into the Qdrant database."""
+def chunk(embedding_model, articles):
+    """Split articles into chunks that fit the embedding model's input."""
+    tokenizer = getattr(embedding_model.model, 'tokenizer', None)
+    return chunk_articles(articles, tokenizer)
+
+def get_qdrant_client():
+    """The shared Qdrant client (see qdrant.py), connected on first use."""
+    from qdrant import qdrant_client
+    return qdrant_client
+
+def store(articles, embeddings, collection, seen=None, sparse=False):
+    """
+    Upsert embedded articles and record them in the seen index.
+    With sparse=True the points also get BM25 sparse vectors for hybrid search.
+    Returns the number of points upserted.
+    """
+    # Upsert news articles to the collection 
+    upserted = upsert_points(get_qdrant_client(), collection, embeddings, articles, payload_type='news', sparse=sparse)
+
+    # Only remember the articles once they are all stored
+    if seen and upserted == len(articles):
+        seen.mark(articles)
+    return upserted
+
+def load(embedding_model, articles, collection, seen=None, embedding_pool=None, sparse=False):
+    """
+    Load the transformed articles (or article chunks) into the Qdrant database.
+    With an embedding pool, texts missing from the embedding cache are embedded
+    asynchronously in the pool, and (future, cache lookup) is returned; pass
+    both to `store_pending` once the future is done.
+    Otherwise returns the number of points upserted.
+    """
     texts = [article['content'] for article in articles]
+    if embedding_pool is not None:
+        lookup = embedding_model.cache_lookup(texts)
+        return embedding_pool.submit(list(lookup[2].values())), lookup
+
     embeddings = embedding_model.encode_texts(texts)    
+    return store(articles, embeddings, collection, seen, sparse)
 
-    # Upsert news articles to the collection 
-    upsert_points(qdrant_client, collection, embeddings, articles)
+def store_pending(embedding_model, future, lookup, articles, collection, seen=None, sparse=False):
+    """Cache the embeddings computed in the pool, then store the articles."""
+    embeddings = embedding_model.cache_merge(lookup, future.result())
+    return store(articles, embeddings, collection, seen, sparse)
+
+def copy_news(embedding_model, source, target, seen=None, batch_size=256):
+    """
+    Re-embed every point of the `source` collection into `target`, from its
+    stored payload (point ids stay the same). Returns (points read, points stored).
+    """
+    qdrant_client = get_qdrant_client()
+    sparse = has_sparse_vectors(qdrant_client, target)
+    read = stored = 0
+    offset = None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=source, limit=batch_size, offset=offset, with_payload=True, with_vectors=False
+        )
+        chunks = [news_payload_to_article(point.payload) for point in points]
+        if chunks:
+            read += len(chunks)
+            stored += load(embedding_model, chunks, target, seen, sparse=sparse)
+        if offset is None:
+            return read, stored
+
+def ingest_news(tickers, headers, embedding_model, collection_name, date_range, seen,
+                clean_workers=None, embedding_workers=0, threads_per_worker=1):
+    """
+    Extract, transform, chunk and load news for a date range into a collection.
+    With embedding_workers > 0, embedding runs in a process pool while the
+    main loop keeps extracting and cleaning the next batches.
+    Returns counts: failed_batches (extraction), chunks and stored points.
+    """
+    qdrant_client = get_qdrant_client()
+
+    # Indexes for ticker/date filtered search
+    create_payload_indexes(qdrant_client, collection_name)
+
+    # BM25 sparse vectors for hybrid search, if the collection has them
+    sparse = has_sparse_vectors(qdrant_client, collection_name)
+    if not sparse:
+        print(f"Collection '{collection_name}' has no sparse vectors; reindex to enable hybrid search")
+
+    embedding_pool = None
+    if embedding_workers:
+        from embeddings import EmbeddingWorkerPool
+        embedding_pool = EmbeddingWorkerPool(
+            embedding_workers,
+            threads_per_worker,
+            local_model_path=embedding_model.local_model_path,
+            backend=embedding_model.backend,
+        )
+
+    # Batches being embedded in the pool: (future, cache lookup, chunks)
+    pending = deque()
+    failures = []
+    stats = {'failed_batches': 0, 'chunks': 0, 'stored': 0}
 
-def run_news_etl(tickers, headers, embedding_model):
-    """Run the ETL process for news articles."""
+    try:
+        with create_cleaning_pool(clean_workers) as cleaning_pool:
+            # Step 1 - Extract news for all tickers and the whole range concurrently
+            for batch, raw_data in extract_all(tickers, headers, date_range, failures=failures):
+                # Step 2 - Transform Data
+                articles = transform(tickers, raw_data, seen, cleaning_pool)
+                if articles:
+                    # Step 3 - Chunk long articles
+                    chunks = chunk(embedding_model, articles)
+                    stats['chunks'] += len(chunks)
+                    # Step 4 - Load Data
+                    result = load(embedding_model, chunks, collection_name, seen, embedding_pool, sparse)
+                    if embedding_pool is not None:
+                        pending.append((*result, chunks))
+                    else:
+                        stats['stored'] += result
+
+                # Store finished batches; keep at most two per worker in flight
+                while pending and (pending[0][0].done() or len(pending) > 2 * embedding_workers):
+                    stats['stored'] += store_pending(embedding_model, *pending.popleft(),
+                                                     collection_name, seen, sparse)
+
+        # Store the remaining batches
+        while pending:
+            stats['stored'] += store_pending(embedding_model, *pending.popleft(), collection_name, seen, sparse)
+    finally:
+        if embedding_pool:
+            embedding_pool.close()
 
-    # Get the current date
+    stats['failed_batches'] = len(failures)
+    if failures:
+        print(f"News extraction failed for {len(failures)} ticker batches")
+    if stats['stored'] < stats['chunks']:
+        print(f"Stored {stats['stored']} of {stats['chunks']} chunks in '{collection_name}'")
+    return stats
+
+def run_news_etl(tickers, headers, embedding_model, lookback_days=30, seen=None, clean_workers=None,
+                 embedding_workers=int(os.getenv("EMBEDDING_WORKERS", "0")), threads_per_worker=1,
+                 reindex=False):
+    """
+    Run the ETL process for news articles.
+    By default new articles are added to the existing 'news' collection.
+    With reindex=True everything is rebuilt into a fresh collection (the
+    current collection's points re-embedded from their payloads, then the
+    last `lookback_days` of news) and the 'news' alias is switched to it once
+    done, so search never sees an empty, half-built or truncated collection.
+    If anything fails, the rebuild is discarded and the current collection kept;
+    after a switch the previous collection is kept for rollback.
+    """
+    seen = seen or SeenIndex()
+    qdrant_client = get_qdrant_client()
+
+    # Get the current date range
     current_date = datetime.now()
+    start_date = current_date - timedelta(days=lookback_days)
+    date_range = (start_date.strftime('%Y-%m-%dT00:00:00Z'), current_date.strftime('%Y-%m-%dT00:00:00Z'))
+    options = dict(clean_workers=clean_workers, embedding_workers=embedding_workers,
+                   threads_per_worker=threads_per_worker)
 
-    # Check if the collection already exists, if not create a new one    
     collection_name = 'news'
-    create_collection(qdrant_client, collection_name, vector_size=768)
+    if reindex:
+        # Rebuild everything: start from an empty seen index, then adopt its entries
+        rebuild_seen = SeenIndex(":memory:")
 
-    # Run ETL for each date and ticker
-    for i in range(30):
-        end_date = current_date - timedelta(days=i)
-        start_date = end_date - timedelta(days=1)
-        
-        date_range = (start_date.strftime('%Y-%m-%dT00:00:00Z'), end_date.strftime('%Y-%m-%dT00:00:00Z'))
-        
-        for ticker in tickers:
-            # Step 1 - Extraction Data
-            raw_data = extract(ticker, headers, date_range)            
-            if raw_data:
-                # Step 2 - Transform Data
-                articles = transform(ticker, raw_data)
-                # Step 3 - Load Data
-                load(embedding_model, articles, collection_name)
+        source = resolve_alias(qdrant_client, collection_name) or \
+            (collection_name if qdrant_client.collection_exists(collection_name) else None)
+
+        def build(name):
+            # Keep the history: the news API is only re-queried for the lookback window
+            if source:
+                read, stored = copy_news(embedding_model, source, name, rebuild_seen)
+                if stored < read:
+                    raise RuntimeError(f"Copied only {stored} of {read} points from '{source}' into '{name}'")
+                print(f"Copied {stored} points from '{source}' into '{name}'")
+            stats = ingest_news(tickers, headers, embedding_model, name, date_range, rebuild_seen, **options)
+            if stats['failed_batches'] or stats['stored'] < stats['chunks']:
+                raise RuntimeError(f"Rebuild of '{name}' is incomplete: {stats}")
 
-            # Pause for 1 second to prevent API limits
-            time.sleep(1)            
+        reindex_collection(qdrant_client, collection_name, build=build, vector_size=768)
+        seen.replace_with(rebuild_seen)
+        return
+
+    # Create the collection if it doesn't exist yet (existing data is kept)
+    create_collection(qdrant_client, collection_name, vector_size=768)
+    ingest_news(tickers, headers, embedding_model, collection_name, date_range, seen, **options)
 
 # Run the ETL process for the specified tickers
-run_news_etl(
-    tickers=["AAPL", "MSFT", "GOOGL", "AMZN", "META", "NVDA", "TSLA"], 
-    headers=set_headers(api_key=os.getenv("ALPACA_API_KEY"), secret_key=os.getenv("ALPACA_SECRET_KEY")), 
-    embedding_model=EmbeddingModel("./src/embeddings/multi-qa-mpnet-base-dot-v1")
-)
\ No newline at end of file
+if __name__ == "__main__":
+    from embeddings import EmbeddingModel
+    run_news_etl(
+        tickers=["AAPL", "MSFT", "GOOGL", "AMZN", "META", "NVDA", "TSLA"], 
+        headers=set_headers(api_key=os.getenv("ALPACA_API_KEY"), secret_key=os.getenv("ALPACA_SECRET_KEY")), 
+        embedding_model=EmbeddingModel("./src/embeddings/multi-qa-mpnet-base-dot-v1")
+    )
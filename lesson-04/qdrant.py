@@ -27,10 +27,22 @@ logger.info(f"QDRANT_API_KEY: {os.getenv('QDRANT_API_KEY')}")
 qdrant_url = os.getenv("QDRANT_ENDPOINT")
 logger.info(f"Qdrant URL: {qdrant_url}")
 
-qdrant_client = QdrantClient(
-    url=qdrant_url, 
-    api_key=api_key,  # Auth required for Qdrant Cloud
-)
+# Use gRPC (port 6334) for faster bulk upserts where the server exposes it
+prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+
+# "qdrant" (default) or "local" for the embedded store in vectorstore/local_store.py
+vector_backend = os.getenv("VECTOR_BACKEND", "qdrant")
+
+if vector_backend == "local":
+    from vectorstore import LocalClient
+    qdrant_client = LocalClient(os.getenv("LOCAL_VECTOR_DIR", "./vector_store"))
+    logger.info(f"Using local vector store at {qdrant_client.path}")
+else:
+    qdrant_client = QdrantClient(
+        url=qdrant_url, 
+        api_key=api_key,  # Auth required for Qdrant Cloud
+        prefer_grpc=prefer_grpc,
+    )
 
 # ------------------------------------------------------------------------------
 # Attempt to retrieve the list of collections
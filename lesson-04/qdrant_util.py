@@ -1,37 +1,275 @@
+import os
+import uuid
 import hashlib
 import logging
-from time import time
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from vectorstore import bm25
+from vectorstore.filters import build_filter
+from vectorstore.hybrid import SPARSE_VECTOR, hybrid_query
 from qdrant_client.models import (
+    Batch,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
     Distance, 
+    Modifier,
+    PayloadSchemaType,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    SparseVector,
+    SparseVectorParams,
     VectorParams, 
-    PointStruct
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
 )
 
 logger = logging.getLogger(__name__)
 
-def create_collection(client, name, vector_size=768, distance=Distance.COSINE):
-    client.recreate_collection(
+# Vector quantization for new collections: "scalar" (int8), "binary" or "" for none
+QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "")
+
+# Candidates fetched per result from the quantized vectors, then rescored
+# with the full-precision vectors (binary quantization needs more than int8)
+OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+
+def quantization_config(quantization):
+    """
+    Quantization config for a collection.
+    Scalar keeps 4x less data in RAM (int8), binary 32x less (1 bit per dimension).
+
+    :param quantization: "scalar", "binary", or None/"" for no quantization
+    """
+    if not quantization:
+        return None
+    if quantization == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown quantization '{quantization}', expected 'scalar' or 'binary'")
+
+def resolve_alias(client, name):
+    """Return the collection an alias points to, or None if `name` is not an alias."""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == name:
+            return alias.collection_name
+    return None
+
+def validate_collection(client, name, vector_size=768, distance=Distance.COSINE):
+    """Raise ValueError if an existing collection's vectors don't match the expected schema."""
+    vectors = client.get_collection(name).config.params.vectors
+    if not isinstance(vectors, VectorParams):
+        raise ValueError(f"Collection '{name}' uses named vectors, expected a single vector")
+    if vectors.size != vector_size or vectors.distance != distance:
+        raise ValueError(
+            f"Collection '{name}' has {vectors.size}-d {vectors.distance} vectors, "
+            f"expected {vector_size}-d {distance}"
+        )
+
+def create_collection(client, name, vector_size=768, distance=Distance.COSINE, recreate=False,
+                      quantization=QUANTIZATION):
+    """
+    Create a collection if it doesn't exist yet (`name` may also be an alias).
+    An existing collection is kept and its vector config validated.
+    Pass recreate=True to drop and rebuild it.
+    With quantization ("scalar" or "binary") the quantized vectors are kept in
+    RAM and the full-precision vectors on disk, for rescoring.
+    New collections also get a BM25 sparse vector (SPARSE_VECTOR) for hybrid search.
+    """
+    name = resolve_alias(client, name) or name
+    exists = client.collection_exists(name)
+    if exists and not recreate:
+        validate_collection(client, name, vector_size, distance)
+        logger.info(f"Collection '{name}' already exists.")
+        return
+    if exists:
+        client.delete_collection(name)
+    config = quantization_config(quantization)
+    client.create_collection(
         collection_name=name,
-        vectors_config=VectorParams(size=vector_size, distance=distance),
+        vectors_config=VectorParams(size=vector_size, distance=distance, on_disk=config is not None),
+        quantization_config=config,
+        sparse_vectors_config={SPARSE_VECTOR: SparseVectorParams(modifier=Modifier.IDF)},
     )
+    logger.info(f"Created collection '{name}'" + (f" with {quantization} quantization." if quantization else "."))
+
+def has_sparse_vectors(client, name):
+    """Whether a collection (or alias) has the BM25 sparse vector used by hybrid search."""
+    name = resolve_alias(client, name) or name
+    return SPARSE_VECTOR in (client.get_collection(name).config.params.sparse_vectors or {})
+
+def create_payload_indexes(client, collection_name):
+    """Index the payload fields used to filter news search (ticker, symbols, created_at)."""
+    indexes = {
+        "metadata.ticker": PayloadSchemaType.KEYWORD,
+        "metadata.symbols": PayloadSchemaType.KEYWORD,
+        "metadata.created_at": PayloadSchemaType.DATETIME,
+    }
+    for field_name, field_schema in indexes.items():
+        client.create_payload_index(collection_name, field_name=field_name, field_schema=field_schema)
+
+def reindex_collection(client, alias, build, vector_size=768, distance=Distance.COSINE, keep_old=True,
+                       quantization=QUANTIZATION, min_points=1, min_ratio=0.5):
+    """
+    Blue/green rebuild: fill a new collection, then atomically point `alias` at it.
+    `build(collection_name)` loads the data and must raise if anything failed;
+    searches through the alias keep using the old collection until the switch.
+    The new collection replaces the old one entirely, so `build` must load
+    everything that should be kept (e.g. copy the old points, see news_etl).
+
+    The switch only happens if the build succeeded and the new collection has
+    at least `min_points` points and `min_ratio` times the old one's; otherwise
+    the new collection is dropped, the alias is left alone and the error raised.
+    The old collection is kept for rollback (point the alias back at it) unless
+    keep_old=False. Returns the new collection name.
+    """
+    old_name = resolve_alias(client, alias)
+    new_name = f"{alias}_{datetime.utcnow():%Y%m%d%H%M%S}_{uuid.uuid4().hex[:8]}"
+    if new_name == old_name or client.collection_exists(new_name):
+        raise RuntimeError(f"Collection '{new_name}' already exists")
+    old_points = client.get_collection(old_name or alias).points_count or 0 \
+        if (old_name or client.collection_exists(alias)) else 0
+
+    create_collection(client, new_name, vector_size, distance, quantization=quantization)
+    try:
+        build(new_name)
+        new_points = client.get_collection(new_name).points_count or 0
+        if new_points < max(min_points, min_ratio * old_points):
+            raise RuntimeError(
+                f"Rebuilt collection '{new_name}' has {new_points} points, expected at least "
+                f"{max(min_points, int(min_ratio * old_points))} (old collection: {old_points})"
+            )
+    except Exception:
+        logger.error(f"Reindex of '{alias}' failed; dropping '{new_name}' and keeping the current collection.")
+        client.delete_collection(new_name)
+        raise
+
+    # The alias may have moved while building
+    old_name = resolve_alias(client, alias)
+    operations = []
+    if old_name:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    elif client.collection_exists(alias):
+        # One-time migration from a plain collection to an alias:
+        # the name must be freed before the alias can take it
+        logger.warning(f"Replacing collection '{alias}' with an alias; search is briefly unavailable.")
+        client.delete_collection(alias)
+    operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=new_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    logger.info(f"Alias '{alias}' now points to '{new_name}'.")
+
+    if old_name and not keep_old:
+        client.delete_collection(old_name)
+    return new_name
+
+def article_key(article):
+    """
+    Stable key for an article: its Alpaca id, else its URL, else a hash of its content.
+    """
+    if article.get('id'):
+        return f"id:{article['id']}"
+    if article.get('url'):
+        return f"url:{article['url']}"
+    return "md5:" + hashlib.md5((article.get('content') or '').encode()).hexdigest()
 
 def unique_id_generator(payload):
-    payload = payload.get('metadata')
-    unique_id = int(hashlib.md5(f"{payload['ticker']}_{payload.get('created_at')}__{time() * 1000}".encode()).hexdigest(), 16) % (10 ** 10)
+    """
+    Deterministic point ID derived from the article key (and chunk index),
+    so re-ingesting the same article overwrites its points instead of adding new ones.
+    """
+    metadata = payload.get('metadata')
+    key = article_key({
+        'id': metadata.get('article_id'),
+        'url': metadata.get('url'),
+        'content': payload.get('page_content'),
+    })
+    if metadata.get('chunk_index') is not None:
+        key = f"{key}#{metadata['chunk_index']}"
+    unique_id = int(hashlib.md5(key.encode()).hexdigest(), 16) % (2 ** 63)
     return unique_id
 
+class SeenIndex:
+    """
+    Local SQLite index of articles already stored, keyed by article_key.
+    Lets the news ETL skip cleaning, embedding and upserting articles it has
+    seen before. Articles whose updated_at changed are treated as new.
+    """
+    def __init__(self, path="./seen_articles.db"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, updated_at TEXT NOT NULL)"
+            )
+
+    def filter_new(self, articles):
+        """Return the articles that are not stored yet or were updated since."""
+        keys = [article_key(article) for article in articles]
+        with self.lock:
+            seen = {}
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                seen.update(self.conn.execute(
+                    f"SELECT key, updated_at FROM seen WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+        return [
+            article for key, article in zip(keys, articles)
+            if key not in seen or (article.get('updated_at') or '') > seen[key]
+        ]
+
+    def replace_with(self, other):
+        """Replace this index's entries with those of another SeenIndex."""
+        with other.lock:
+            rows = other.conn.execute("SELECT key, updated_at FROM seen").fetchall()
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM seen")
+            self.conn.executemany("INSERT INTO seen (key, updated_at) VALUES (?, ?)", rows)
+
+    def mark(self, articles):
+        """Record articles as stored."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO seen (key, updated_at) VALUES (?, ?)",
+                [(article_key(article), article.get('updated_at') or '') for article in articles],
+            )
+
 def create_news_payload(article):
     return {
         "metadata": {
+            "article_id": article.get("id"),
             "ticker": article.get("ticker"),
+            "symbols": article.get("symbols") or [article.get("ticker")],
             'created_at': article.get('created_at', ''),
             'updated_at': article.get('updated_at', ''),
             'headline': article.get('headline', ''),
-            'url': article.get('url','')
+            'url': article.get('url',''),
+            'parent_id': article.get('parent_id'),
+            'chunk_index': article.get('chunk_index'),
+            'chunk_count': article.get('chunk_count'),
         },
         "page_content": article.get("content")
     }
 
+def news_payload_to_article(payload):
+    """Inverse of create_news_payload: the article (or chunk) a stored news payload was built from."""
+    metadata = payload.get('metadata') or {}
+    article = {
+        key: metadata.get(key)
+        for key in ('ticker', 'symbols', 'created_at', 'updated_at', 'headline', 'url', 'parent_id',
+                    'chunk_index', 'chunk_count')
+    }
+    article['id'] = metadata.get('article_id')
+    article['content'] = payload.get('page_content')
+    return article
+
 def create_earnings_payload(filing):
     return {
         "metadata": {
@@ -51,57 +289,149 @@ def set_router(collection):
 
     return router[collection]
 
-def upsert_points(client, collection_name, embeddings, items, batch_size=100):
+def build_batches(embeddings, items, payload_type, batch_size=256, sparse=False):
+    """
+    Build columnar point batches (ids, vectors, payloads) for upserting.
+    The embedding matrix is converted to lists in one call rather than per point.
+    With sparse=True each point also gets BM25 weights of its page_content.
+    """
+    create_payload = set_router(payload_type)
+    vectors = embeddings.tolist() if hasattr(embeddings, 'tolist') else [list(v) for v in embeddings]
+    payloads = [create_payload(item) for item in items]
+    ids = [unique_id_generator(payload) for payload in payloads]
+    sparse_vectors = None
+    if sparse:
+        sparse_vectors = [
+            SparseVector(indices=indices, values=values)
+            for indices, values in (bm25.document_vector(payload.get('page_content')) for payload in payloads)
+        ]
 
-    points = []
-    for idx, (item, embedding) in enumerate(zip(items, embeddings)):
+    batches = []
+    for i in range(0, len(ids), batch_size):
+        batch_vectors = vectors[i:i + batch_size]
+        if sparse_vectors is not None:
+            batch_vectors = {"": batch_vectors, SPARSE_VECTOR: sparse_vectors[i:i + batch_size]}
+        batches.append(Batch(ids=ids[i:i + batch_size], vectors=batch_vectors, payloads=payloads[i:i + batch_size]))
+    return batches
 
-        try:            
-            vector = embedding.tolist()  # Convert embedding to a list
+def upsert_batch(client, collection_name, batch, max_retries=3, backoff=0.5):
+    """
+    Upsert one batch, retrying with exponential backoff.
+    Returns a result dict: points, ok, attempts and the last error (if any).
+    """
+    error = None
+    for attempt in range(1, max_retries + 2):
+        try:
+            client.upsert(collection_name=collection_name, points=batch, wait=True)
+            return {'points': len(batch.ids), 'ok': True, 'attempts': attempt, 'error': None}
+        except Exception as e:
+            error = e
+            logger.warning(f"Upsert of {len(batch.ids)} points failed (attempt {attempt}): {e}")
+            if attempt <= max_retries:
+                time.sleep(backoff * 2 ** (attempt - 1))
+    return {'points': len(batch.ids), 'ok': False, 'attempts': max_retries + 1, 'error': str(error)}
 
-            # Prepare payload in LangChain Document format
-            create_payload = set_router(collection_name)
-            payload = create_payload(item)
+def bulk_upsert(client, collection_name, embeddings, items, batch_size=256, parallel=4,
+                max_retries=3, payload_type=None, sparse=False):
+    """
+    Upsert items with their embeddings, sending batches concurrently over the
+    shared client. A failed batch is retried and reported; it does not stop
+    the other batches. Returns one result dict per batch, in order.
+    """
+    batches = build_batches(embeddings, items, payload_type or collection_name, batch_size, sparse)
+    if parallel <= 1 or len(batches) <= 1:
+        results = [upsert_batch(client, collection_name, batch, max_retries) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            results = list(executor.map(
+                lambda batch: upsert_batch(client, collection_name, batch, max_retries), batches
+            ))
 
-            # Generate unique ID
-            idx = unique_id_generator(payload)
+    for i, result in enumerate(results):
+        result['batch'] = i
+    ok = sum(result['points'] for result in results if result['ok'])
+    failed = [result for result in results if not result['ok']]
+    logger.info(f"Upserted {ok} points in {len(results)} batches into '{collection_name}'.")
+    for result in failed:
+        logger.error(f"Batch {result['batch']} ({result['points']} points) failed: {result['error']}")
+    return results
 
-            # Log data for debugging
-            logger.debug(f"Point ID: {idx}, Vector Length: {len(vector)}, Payload Keys: {payload.keys()}")
+def upsert_points(client, collection_name, embeddings, items, batch_size=256, payload_type=None, parallel=4,
+                  sparse=False):
+    """
+    Upsert items with their embeddings. Returns the number of points upserted.
+    payload_type selects the payload format ('news', 'earnings'); it defaults
+    to the collection name. sparse=True adds BM25 sparse vectors (see has_sparse_vectors).
+    """
+    results = bulk_upsert(client, collection_name, embeddings, items, batch_size, parallel,
+                          payload_type=payload_type, sparse=sparse)
+    return sum(result['points'] for result in results if result['ok'])
 
-            point = PointStruct(
-                id=idx,
-                vector=vector,
-                payload=payload
-            )
-            points.append(point)
+def search_params(oversampling=OVERSAMPLING, rescore=True, ignore=False, exact=False):
+    """
+    Search parameters for quantized collections (ignored by unquantized ones).
 
-        except Exception as e:
-            logger.error(f"Error creating point at index {idx}: {e}")
-            continue  # Skip to the next point
-
-        # Upsert in batches
-        if len(points) >= batch_size:
-            try:
-                client.upsert(collection_name=collection_name, points=points, wait=True)
-                logger.info(f"Upserted {len(points)} points.")
-                points = []  # Clear the batch
-            except Exception as e:
-                logger.error(f"Error upserting batch: {e}")
-                break  # Stop upserting if a batch fails
-
-    # Upsert any remaining points
-    if points:
-        try:
-            client.upsert(collection_name=collection_name, points=points, wait=True)
-            logger.info(f"Upserted remaining {len(points)} points.")
-        except Exception as e:
-            logger.error(f"Error upserting remaining batch: {e}")
+    :param oversampling: Fetch limit * oversampling candidates from the quantized vectors
+    :param rescore: Re-rank the candidates with the full-precision vectors
+    :param ignore: Skip the quantized vectors and search full precision only
+    :param exact: Exhaustive search instead of the HNSW index
+    """
+    return SearchParams(
+        exact=exact,
+        quantization=QuantizationSearchParams(ignore=ignore, rescore=rescore, oversampling=oversampling),
+    )
 
-def search(client, collection_name, query_vector, limit=3):
+def search(client, collection_name, query_vector, limit=3, tickers=None, start_date=None, end_date=None, days=None,
+           oversampling=OVERSAMPLING, rescore=True):
     results = client.search(
         collection_name=collection_name,
         query_vector=query_vector,
+        query_filter=build_filter(tickers, start_date, end_date, days),
+        search_params=search_params(oversampling, rescore),
         limit=limit
     )
     return results
+
+def hybrid_search(client, collection_name, query_vector, query_text, limit=3, tickers=None, start_date=None,
+                  end_date=None, days=None, prefetch_limit=None):
+    """
+    Dense + BM25 sparse search, fused with reciprocal rank fusion in one query.
+    Both prefetches use the same filter; each returns prefetch_limit candidates
+    (default 4 * limit). The collection needs the sparse vector (has_sparse_vectors).
+    """
+    return hybrid_query(client, collection_name, query_vector, query_text, limit,
+                        build_filter(tickers, start_date, end_date, days), prefetch_limit, search_params())
+
+def quantization_report(client, collection_name, query_vectors, limit=10, oversampling_values=(1.0, 2.0, 4.0)):
+    """
+    Measure recall@limit and mean latency of quantized search against the
+    full-precision baseline (exact search, quantization ignored).
+    Returns one row per setting: mode, oversampling, recall, latency_ms.
+    """
+    def run(params):
+        results, elapsed = [], 0.0
+        for query_vector in query_vectors:
+            start = time.perf_counter()
+            hits = client.search(collection_name=collection_name, query_vector=query_vector,
+                                 search_params=params, limit=limit)
+            elapsed += time.perf_counter() - start
+            results.append({hit.id for hit in hits})
+        return results, elapsed / len(query_vectors) * 1000
+
+    baseline, baseline_ms = run(search_params(ignore=True, exact=True))
+    report = [{'mode': 'float32 exact', 'oversampling': None, 'recall': 1.0, 'latency_ms': baseline_ms}]
+
+    settings = [('float32 hnsw', None, dict(ignore=True))]
+    settings.append(('quantized', 1.0, dict(oversampling=1.0, rescore=False)))
+    settings += [('quantized + rescore', value, dict(oversampling=value)) for value in oversampling_values]
+    for mode, oversampling, params in settings:
+        results, latency_ms = run(search_params(**params))
+        recall = sum(
+            len(found & expected) / max(len(expected), 1) for found, expected in zip(results, baseline)
+        ) / len(baseline)
+        report.append({'mode': mode, 'oversampling': oversampling, 'recall': recall, 'latency_ms': latency_ms})
+
+    for row in report:
+        logger.info(f"{row['mode']:<20} oversampling={row['oversampling']}: "
+                    f"recall@{limit}={row['recall']:.3f}, {row['latency_ms']:.1f} ms")
+    return report
@@ -0,0 +1,58 @@
+"""
+Recall vs latency of quantized search on the news collection.
+
+Compares quantized search (with and without full-precision rescoring, at
+several oversampling factors) against exact float32 search, using a few
+sample questions as queries. Create the collection quantized with
+QDRANT_QUANTIZATION=scalar|binary, or pass --quantization to add it to an
+existing collection (Qdrant rebuilds the quantized vectors in the background).
+
+```
+python quantization_report.py --quantization scalar
+```
+"""
+import argparse
+from qdrant import qdrant_client
+from qdrant_util import quantization_config, quantization_report, resolve_alias
+from embeddings import EmbeddingModel
+
+SAMPLE_QUERIES = [
+    "What did Apple announce at its latest product event?",
+    "Why did Nvidia stock move after earnings?",
+    "Tesla delivery numbers this quarter",
+    "Microsoft cloud revenue growth",
+    "Amazon layoffs and cost cutting",
+    "Meta spending on AI infrastructure",
+    "Alphabet antitrust ruling",
+    "Which chip makers are affected by export restrictions?",
+    "Analyst upgrades and downgrades for big tech",
+    "Federal Reserve interest rate decision impact on tech stocks",
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--collection", default="news")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--quantization", choices=["scalar", "binary"],
+                        help="Enable this quantization on the collection before measuring")
+    args = parser.parse_args()
+
+    collection_name = resolve_alias(qdrant_client, args.collection) or args.collection
+    if args.quantization:
+        qdrant_client.update_collection(collection_name, quantization_config=quantization_config(args.quantization))
+        print(f"Enabled {args.quantization} quantization on '{collection_name}'")
+
+    if qdrant_client.get_collection(collection_name).config.quantization_config is None:
+        print(f"Note: '{collection_name}' is not quantized; all modes search full-precision vectors")
+
+    embedding_model = EmbeddingModel("./src/embeddings/multi-qa-mpnet-base-dot-v1")
+    query_vectors = embedding_model.encode_texts(SAMPLE_QUERIES).tolist()
+    report = quantization_report(qdrant_client, collection_name, query_vectors, limit=args.limit)
+
+    print(f"{'mode':<22}{'oversampling':>14}{'recall@' + str(args.limit):>12}{'latency ms':>12}")
+    for row in report:
+        oversampling = "-" if row['oversampling'] is None else f"{row['oversampling']:g}"
+        print(f"{row['mode']:<22}{oversampling:>14}{row['recall']:>12.3f}{row['latency_ms']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
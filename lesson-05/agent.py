@@ -6,6 +6,7 @@ Agent
 #%%
 import os
 import sys
+from typing import List, Optional
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 
@@ -81,9 +82,21 @@ def tavily_search_tool(query: str):
     return result.invoke({"query": query})[0]["content"]
 
 @tool
-def vector_search_tool(query: str):
-    """Use this tool to get the latest news"""
-    result = vector_search(query)
+def vector_search_tool(
+    query: str,
+    tickers: Optional[List[str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    days: Optional[int] = None,
+):
+    """
+    Use this tool to get the latest news.
+    Narrow the search whenever the question is about specific companies or a period:
+    - tickers: stock symbols the news must be about, e.g. ["AAPL", "MSFT"]
+    - start_date / end_date: ISO 8601 dates, e.g. "2025-06-01" (both days included)
+    - days: only news from the last N days (instead of start_date)
+    """
+    result = vector_search(query, tickers=tickers, start_date=start_date, end_date=end_date, days=days)
     return result
 
 # Declare tools
@@ -128,7 +141,7 @@ llm_chain = (prompt_template | model_with_tool)
 # -----------------------------------------------------------
 
 def call_model(state: MessagesState, config: RunnableConfig):
-    response = llm_chain.invoke(state)
+    response = llm_chain.invoke(state, config)  # config carries the streaming callbacks
     return {"messages": response}
 
 # -----------------------------------------------------------
@@ -5,7 +5,9 @@ uv add fastapi uvicorn
 
 #%%
 
+import json
 from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Tuple
 import uvicorn
@@ -33,6 +35,28 @@ class AgentResponse(BaseModel):
     # history: List[Message]
     response: str
 
+def stream_event(event):
+    """
+    Translate a LangGraph astream_events (v2) event into a stream message,
+    or None for events the client doesn't need.
+    """
+    kind = event["event"]
+    if kind == "on_chat_model_stream" and event["metadata"].get("langgraph_node") == "model":
+        content = event["data"]["chunk"].content
+        if content and isinstance(content, str):
+            return {"type": "token", "content": content}
+    elif kind == "on_tool_start":
+        return {"type": "tool_start", "name": event["name"], "input": event["data"].get("input")}
+    elif kind == "on_tool_end":
+        output = event["data"].get("output")
+        output = str(getattr(output, "content", output))
+        return {"type": "tool_end", "name": event["name"], "output": output[:500]}
+    elif kind == "on_chain_end" and not event.get("parent_ids"):
+        # The graph run itself finished: its last message is the answer
+        messages = (event["data"].get("output") or {}).get("messages") or []
+        return {"type": "final", "response": messages[-1].content if messages else "No response"}
+    return None
+
 # --------------------------
 # API Route
 # --------------------------
@@ -68,6 +92,33 @@ async def chat(request: AgentRequest):
 
     return AgentResponse(response=reply)
 
+@app.post("/chat/stream")
+async def chat_stream(request: AgentRequest):
+    """
+    Stream the agent run as newline-delimited JSON messages: tokens as the
+    model writes them, tool_start / tool_end around tool calls, then final.
+    """
+    messages: List[Tuple[str, str]] = [(msg.role, msg.content) for msg in request.messages]
+
+    config = RunnableConfig(
+        configurable={
+            "thread_id": request.thread_id,
+            "user_id": request.user_id,
+        },
+        recursion_limit=25
+    )
+
+    async def events():
+        try:
+            async for event in graph.astream_events({"messages": messages}, config, version="v2"):
+                message = stream_event(event)
+                if message:
+                    yield json.dumps(message, default=str) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 # --------------------------
 # Run the app (dev only)
 # --------------------------
@@ -6,11 +6,12 @@ Agent
 #%%
 import os
 import sys
+from typing import List, Optional
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 
 # For system prompt management
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 # Memory persistence
@@ -72,9 +73,21 @@ def tavily_search_tool(query: str):
     return result.invoke({"query": query})[0]["content"]
 
 @tool
-def vector_search_tool(query: str):
-    """Use this tool to get the latest news"""
-    result = vector_search(query)
+def vector_search_tool(
+    query: str,
+    tickers: Optional[List[str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    days: Optional[int] = None,
+):
+    """
+    Use this tool to get the latest news.
+    Narrow the search whenever the question is about specific companies or a period:
+    - tickers: stock symbols the news must be about, e.g. ["AAPL", "MSFT"]
+    - start_date / end_date: ISO 8601 dates, e.g. "2025-06-01" (both days included)
+    - days: only news from the last N days (instead of start_date)
+    """
+    result = vector_search(query, tickers=tickers, start_date=start_date, end_date=end_date, days=days)
     return result
 
 # Declare tools
@@ -119,7 +132,12 @@ llm_chain = (prompt_template | model_with_tool)
 # -----------------------------------------------------------
 
 def call_model(state: MessagesState, config: RunnableConfig):
-    response = llm_chain.invoke(state)
+    response = llm_chain.invoke(state, config)
+    return {"messages": response}
+
+async def acall_model(state: MessagesState, config: RunnableConfig):
+    # Awaited, so the API's event loop keeps serving other requests meanwhile
+    response = await llm_chain.ainvoke(state, config)
     return {"messages": response}
 
 # -----------------------------------------------------------
@@ -133,7 +151,8 @@ memory = MemorySaver()
 agent_graph = StateGraph(state_schema=MessagesState)
 
 # Add graph nodes
-agent_graph.add_node("model", call_model)
+# Sync for graph.invoke (interactive use), async for the API's ainvoke/astream_events
+agent_graph.add_node("model", RunnableLambda(call_model, afunc=acall_model))
 agent_graph.add_node("tools", tool_node)
 
 # Add edges
@@ -141,5 +160,5 @@ agent_graph.add_edge(START, "model")
 agent_graph.add_conditional_edges("model", tools_condition, ["tools", END])
 agent_graph.add_edge("tools", "model")
 
-# Compile the graph
+# Compile the graph (the API compiles its own with a persistent checkpointer, see checkpointer.py)
 graph = agent_graph.compile(checkpointer=memory)
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Checkpointer backends for the agent's conversation memory.
+
+CHECKPOINTER selects where conversation state is kept:
+- memory: in-process (default; lost on restart, not shared between pods)
+- sqlite: a local SQLite file at CHECKPOINT_DB
+- postgres: Postgres at CHECKPOINT_URL, shared by every replica
+- redis: Redis Stack at CHECKPOINT_URL, shared by every replica
+
+Threads idle for CHECKPOINT_TTL_SECONDS are deleted, and at most
+CHECKPOINT_MAX_THREADS threads are kept (the least recently active go
+first). Redis expires idle threads itself; cap its size with maxmemory.
+
+Each persistent backend is an optional extra of the project (the image
+installs the one passed as the CHECKPOINTER build arg):
+
+```
+uv sync --extra sqlite    # or postgres, redis
+```
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import MemorySaver
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTER = os.getenv("CHECKPOINTER", "memory")
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "./checkpoints.db")
+CHECKPOINT_URL = os.getenv("CHECKPOINT_URL", "")
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 3600)))
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "10000"))
+CHECKPOINT_SWEEP_SECONDS = int(os.getenv("CHECKPOINT_SWEEP_SECONDS", "300"))
+
+# 100 ns intervals between the UUID epoch (1582-10-15) and the Unix epoch
+UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+@asynccontextmanager
+async def open_checkpointer(backend=CHECKPOINTER):
+    """
+    Open the configured checkpointer; its connections close on exit.
+    Fails at startup if the saver can't delete threads, since idle threads
+    would then never be evicted.
+    """
+    async with _open_saver(backend) as saver:
+        delete_thread = getattr(type(saver), "adelete_thread", None)
+        if backend != "redis" and delete_thread in (None, getattr(BaseCheckpointSaver, "adelete_thread", None)):
+            raise RuntimeError(
+                f"{type(saver).__name__} cannot delete threads; upgrade langgraph-checkpoint (>=2.0.25) and its backend package"
+            )
+        yield saver
+
+@asynccontextmanager
+async def _open_saver(backend):
+    if backend == "memory":
+        yield MemorySaver()
+    elif backend == "sqlite":
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB) as saver:
+            await saver.setup()
+            yield saver
+    elif backend == "postgres":
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+        async with AsyncPostgresSaver.from_conn_string(CHECKPOINT_URL) as saver:
+            await saver.setup()
+            yield saver
+    elif backend == "redis":
+        from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+        # Redis expires idle threads; reading a thread renews its TTL (in minutes)
+        ttl = {"default_ttl": CHECKPOINT_TTL_SECONDS / 60, "refresh_on_read": True}
+        async with AsyncRedisSaver.from_conn_string(CHECKPOINT_URL, ttl=ttl) as saver:
+            await saver.asetup()
+            yield saver
+    else:
+        raise ValueError(f"Unknown CHECKPOINTER '{backend}', expected memory, sqlite, postgres or redis")
+
+def checkpoint_time(checkpoint_id):
+    """Unix time a checkpoint was written, decoded from its (UUID v6) id."""
+    high = uuid.UUID(checkpoint_id).int >> 64
+    timestamp = ((high >> 16) << 12) | (high & 0x0FFF)
+    return (timestamp - UUID_EPOCH_OFFSET) / 1e7
+
+async def latest_checkpoints(saver, backend=CHECKPOINTER):
+    """Latest checkpoint id of every thread: {thread_id: checkpoint_id}."""
+    if backend == "memory":
+        return {
+            thread_id: max(checkpoint_id for checkpoints in namespaces.values() for checkpoint_id in checkpoints)
+            for thread_id, namespaces in list(saver.storage.items())
+            if any(namespaces.values())
+        }
+    query = "SELECT thread_id, MAX(checkpoint_id) AS checkpoint_id FROM checkpoints GROUP BY thread_id"
+    if backend == "sqlite":
+        async with saver.conn.execute(query) as cursor:
+            return dict(await cursor.fetchall())
+    if backend == "postgres":
+        async with saver.conn.cursor() as cursor:
+            await cursor.execute(query)
+            return {row["thread_id"]: row["checkpoint_id"] for row in await cursor.fetchall()}
+    raise ValueError(f"Thread eviction is not supported for '{backend}'")
+
+async def evict_threads(saver, backend=CHECKPOINTER, ttl_seconds=CHECKPOINT_TTL_SECONDS,
+                        max_threads=CHECKPOINT_MAX_THREADS):
+    """
+    Delete threads idle for longer than ttl_seconds, then the least recently
+    active ones beyond max_threads. Returns the number of threads deleted.
+    """
+    last_active = {
+        thread_id: checkpoint_time(checkpoint_id)
+        for thread_id, checkpoint_id in (await latest_checkpoints(saver, backend)).items()
+    }
+    cutoff = time.time() - ttl_seconds
+    expired = [thread_id for thread_id, active in last_active.items() if active < cutoff]
+    remaining = sorted(
+        (thread_id for thread_id, active in last_active.items() if active >= cutoff), key=last_active.get
+    )
+    if len(remaining) > max_threads:
+        expired += remaining[:len(remaining) - max_threads]
+
+    for thread_id in expired:
+        await saver.adelete_thread(thread_id)
+    if expired:
+        logger.info(f"Evicted {len(expired)} conversation threads ({len(last_active) - len(expired)} kept).")
+    return len(expired)
+
+async def run_eviction(saver, backend=CHECKPOINTER, interval=CHECKPOINT_SWEEP_SECONDS):
+    """Evict threads every `interval` seconds, until cancelled."""
+    if backend == "redis":
+        return  # Expired by Redis itself
+    while True:
+        try:
+            await evict_threads(saver, backend)
+        except Exception as e:
+            logger.warning(f"Thread eviction failed: {e}")
+        await asyncio.sleep(interval)
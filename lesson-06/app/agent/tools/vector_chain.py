@@ -1,8 +1,15 @@
 import os
+import time
+import queue
 import logging
+import threading
+from concurrent.futures import Future
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient
+from qdrant_client.models import QuantizationSearchParams, SearchParams
 from sentence_transformers import SentenceTransformer
+from vectorstore.filters import build_filter
+from vectorstore.hybrid import hybrid_query
 
 # ------------------------------------------------------------------------------
 # Load environment variables from .env file
@@ -18,10 +25,17 @@ QDRANT_ENDPOINT = os.getenv("QDRANT_ENDPOINT")
 # Create a Qdrant client instance
 # ------------------------------------------------------------------------------
 
-qdrant_client = QdrantClient(
-    url=QDRANT_ENDPOINT, 
-    api_key=QDRANT_API_KEY,  # Auth required for Qdrant Cloud
-)
+# "qdrant" (default) or "local" to search the embedded store built by the news ETL
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+
+if VECTOR_BACKEND == "local":
+    from vectorstore import LocalClient
+    qdrant_client = LocalClient(os.getenv("LOCAL_VECTOR_DIR", "./vector_store"))
+else:
+    qdrant_client = QdrantClient(
+        url=QDRANT_ENDPOINT, 
+        api_key=QDRANT_API_KEY,  # Auth required for Qdrant Cloud
+    )
 
 # ------------------------------------------------------------------------------
 # Step 2: Initialize Embeddings
@@ -29,15 +43,126 @@ qdrant_client = QdrantClient(
 
 embedding_model = SentenceTransformer("sentence-transformers/multi-qa-mpnet-base-dot-v1")
 
+# ------------------------------------------------------------------------------
+# Query Micro-batching
+# ------------------------------------------------------------------------------
+
+class QueryBatcher:
+    """
+    Collects queries that arrive within `max_wait_ms` of each other and encodes
+    them in one forward pass on a background thread, so concurrent requests
+    share the model instead of queuing for it one call at a time.
+    """
+    def __init__(self, model, max_batch_size=32, max_wait_ms=5):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, query):
+        """Queue a query; returns a Future resolving to its embedding."""
+        future = Future()
+        self.queue.put((query, future))
+        return future
+
+    def encode(self, query, timeout=None):
+        """Embed a single query, blocking until its batch is encoded."""
+        return self.submit(query).result(timeout)
+
+    def _run(self):
+        while True:
+            # Wait for a first query, then gather more until the window closes
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            queries = [query for query, _ in batch]
+            try:
+                embeddings = self.model.encode(queries, batch_size=len(queries), show_progress_bar=False)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+query_batcher = QueryBatcher(
+    embedding_model,
+    max_batch_size=int(os.getenv("QUERY_BATCH_SIZE", "32")),
+    max_wait_ms=float(os.getenv("QUERY_BATCH_WAIT_MS", "5")),
+)
+
 # ------------------------------------------------------------------------------
 # Search Function
 # ------------------------------------------------------------------------------
 
-def vector_search(query, limit_size=3):
-    query_embedding = embedding_model.encode(query).tolist()
-    search_results = qdrant_client.search(
-        collection_name="news",
-        query_vector=query_embedding,
-        limit=limit_size,
-    )
-    return search_results
\ No newline at end of file
+# Chunk hits fetched per requested article when merging chunks
+CHUNK_OVERSAMPLING = 4
+
+# "dense" (default) or "hybrid": dense + BM25 sparse search fused with
+# reciprocal rank fusion (needs a news collection built with sparse vectors)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "dense")
+
+# Candidates each hybrid prefetch contributes per result
+HYBRID_PREFETCH = 2
+
+# Quantized collections: candidates per result taken from the quantized
+# vectors and rescored at full precision (no effect without quantization)
+QUANTIZATION_SEARCH = SearchParams(quantization=QuantizationSearchParams(
+    rescore=True,
+    oversampling=float(os.getenv("QDRANT_OVERSAMPLING", "2.0")),
+))
+
+def merge_chunk_hits(hits, limit):
+    """
+    Merge chunk hits back into one hit per article, ranked by its best chunk.
+    The merged hit's page_content joins the article's matched chunks in order.
+    """
+    articles = {}
+    for hit in hits:  # Hits arrive best-first
+        metadata = hit.payload.get("metadata", {})
+        articles.setdefault(metadata.get("parent_id") or hit.id, []).append(hit)
+
+    merged = []
+    for chunk_hits in list(articles.values())[:limit]:
+        best = chunk_hits[0]
+        chunk_hits.sort(key=lambda hit: hit.payload.get("metadata", {}).get("chunk_index") or 0)
+        best.payload = {
+            **best.payload,
+            "page_content": "\n...\n".join(hit.payload.get("page_content") or "" for hit in chunk_hits),
+        }
+        merged.append(best)
+    return merged
+
+def vector_search(query, limit_size=3, merge_chunks=True, tickers=None, start_date=None, end_date=None, days=None,
+                  mode=SEARCH_MODE):
+    query_embedding = query_batcher.encode(query).tolist()
+    query_filter = build_filter(tickers, start_date, end_date, days)
+    limit = limit_size * CHUNK_OVERSAMPLING if merge_chunks else limit_size
+
+    if mode == "hybrid":
+        # Exact terms (tickers, names, figures) from BM25, meaning from the dense vectors
+        search_results = hybrid_query(
+            qdrant_client, "news", query_embedding, query, limit, query_filter,
+            prefetch_limit=limit * HYBRID_PREFETCH, search_params=QUANTIZATION_SEARCH,
+        )
+    else:
+        search_results = qdrant_client.search(
+            collection_name="news",
+            query_vector=query_embedding,
+            query_filter=query_filter,
+            search_params=QUANTIZATION_SEARCH,
+            limit=limit,
+        )
+    if merge_chunks:
+        search_results = merge_chunk_hits(search_results, limit_size)
+    return search_results
@@ -5,16 +5,86 @@ uv add fastapi uvicorn
 
 #%%
 
-from fastapi import FastAPI, Request
+import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Tuple
 import uvicorn
 
 # Import your agent setup
-from app.agent.agent import graph
+from app.agent.agent import agent_graph
+from app.agent.checkpointer import open_checkpointer, run_eviction
 from langchain_core.runnables import RunnableConfig
 
-app = FastAPI()
+# --------------------------
+# Concurrency Settings
+# --------------------------
+
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", "8"))    # Agent runs in progress at once
+MAX_QUEUED_CHATS = int(os.getenv("MAX_QUEUED_CHATS", "32"))           # Waiting runs before answering 503
+CHAT_TIMEOUT_SECONDS = float(os.getenv("CHAT_TIMEOUT_SECONDS", "120"))  # Queueing + agent run, else 504
+TOOL_THREADS = int(os.getenv("TOOL_THREADS", "32"))                   # Threads for the synchronous tools
+TOOL_OUTPUT_CHARS = 500                                               # Tool output sent in stream events
+
+class ChatLimiter:
+    """
+    Runs at most `limit` chats at once. Further chats wait in line, and are
+    rejected straight away once `max_queued` are already waiting.
+    """
+    def __init__(self, limit, max_queued):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.max_queued = max_queued
+        self.active = 0
+        self.queued = 0
+
+    def check_capacity(self):
+        """Raise a 503 if the line of waiting chats is full."""
+        if self.semaphore.locked() and self.queued >= self.max_queued:
+            raise HTTPException(status_code=503, detail="Too many requests, retry later",
+                                headers={"Retry-After": "5"})
+
+    @asynccontextmanager
+    async def slot(self):
+        self.check_capacity()
+        self.queued += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+chat_limiter = ChatLimiter(MAX_CONCURRENT_CHATS, MAX_QUEUED_CHATS)
+
+# Agent graph, compiled at startup with the configured checkpointer (CHECKPOINTER)
+graph = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global graph
+    # Synchronous tools (SQL agent, vector search, web search) run in this
+    # pool when the graph is awaited, instead of blocking the event loop
+    executor = ThreadPoolExecutor(max_workers=TOOL_THREADS, thread_name_prefix="agent-tool")
+    asyncio.get_running_loop().set_default_executor(executor)
+
+    # Conversation memory, plus eviction of idle threads
+    async with open_checkpointer() as checkpointer:
+        graph = agent_graph.compile(checkpointer=checkpointer)
+        eviction = asyncio.create_task(run_eviction(checkpointer))
+        yield
+        eviction.cancel()
+    executor.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
 
 # --------------------------
 # Request/Response Models
@@ -32,6 +102,42 @@ class AgentRequest(BaseModel):
 class AgentResponse(BaseModel):
     response: str
 
+def agent_input(request: AgentRequest):
+    """Graph input and config for a chat request."""
+    # Convert to LangGraph's MessagesState format (list of tuples)
+    messages: List[Tuple[str, str]] = [(msg.role, msg.content) for msg in request.messages]
+
+    config = RunnableConfig(
+        configurable={
+            "thread_id": request.thread_id,
+            "user_id": request.user_id,
+        },
+        recursion_limit=25
+    )
+    return {"messages": messages}, config
+
+def stream_event(event):
+    """
+    Translate a LangGraph astream_events (v2) event into a stream message,
+    or None for events the client doesn't need.
+    """
+    kind = event["event"]
+    if kind == "on_chat_model_stream" and event["metadata"].get("langgraph_node") == "model":
+        content = event["data"]["chunk"].content
+        if content and isinstance(content, str):
+            return {"type": "token", "content": content}
+    elif kind == "on_tool_start":
+        return {"type": "tool_start", "name": event["name"], "input": event["data"].get("input")}
+    elif kind == "on_tool_end":
+        output = event["data"].get("output")
+        output = str(getattr(output, "content", output))
+        return {"type": "tool_end", "name": event["name"], "output": output[:TOOL_OUTPUT_CHARS]}
+    elif kind == "on_chain_end" and not event.get("parent_ids"):
+        # The graph run itself finished: its last message is the answer
+        messages = (event["data"].get("output") or {}).get("messages") or []
+        return {"type": "final", "response": messages[-1].content if messages else "No response"}
+    return None
+
 # --------------------------
 # API Route
 # --------------------------
@@ -43,29 +149,63 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "active_chats": chat_limiter.active, "queued_chats": chat_limiter.queued}
 
 @app.post("/chat", response_model=AgentResponse)
 async def chat(request: AgentRequest):
-    # Convert to LangGraph's MessagesState format (list of tuples)
-    messages: List[Tuple[str, str]] = [(msg.role, msg.content) for msg in request.messages]
+    graph_input, config = agent_input(request)
 
-    config = RunnableConfig(
-        configurable={
-            "thread_id": request.thread_id,
-            "user_id": request.user_id,
-        },
-        recursion_limit=25
-    )
+    async def run():
+        async with chat_limiter.slot():
+            return await graph.ainvoke(graph_input, config)
 
-    # Invoke the LangGraph agent
-    result = graph.invoke({"messages": messages}, config)
+    # Invoke the LangGraph agent without blocking the event loop
+    try:
+        result = await asyncio.wait_for(run(), timeout=CHAT_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Agent did not answer within {CHAT_TIMEOUT_SECONDS:g}s")
 
     # Extract response message
     reply = result["messages"][-1].content if result and "messages" in result else "No response"
 
     return AgentResponse(response=reply)
 
+@app.post("/chat/stream")
+async def chat_stream(request: AgentRequest):
+    """
+    Stream the agent run as newline-delimited JSON messages:
+    {"type": "token", "content"} for answer tokens as the model writes them,
+    {"type": "tool_start", "name", "input"} / {"type": "tool_end", "name", "output"}
+    around tool calls, then {"type": "final", "response"} or {"type": "error", "detail"}.
+    """
+    graph_input, config = agent_input(request)
+    chat_limiter.check_capacity()  # Reject with a real 503 before the stream starts
+    queue = asyncio.Queue()
+
+    async def run():
+        async with chat_limiter.slot():
+            async for event in graph.astream_events(graph_input, config, version="v2"):
+                message = stream_event(event)
+                if message:
+                    queue.put_nowait(message)
+
+    async def messages():
+        task = asyncio.create_task(asyncio.wait_for(run(), timeout=CHAT_TIMEOUT_SECONDS))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (message := await queue.get()) is not None:
+                yield json.dumps(message, default=str) + "\n"
+            error = task.exception()
+            if isinstance(error, asyncio.TimeoutError):
+                yield json.dumps({"type": "error", "detail": f"Agent did not answer within {CHAT_TIMEOUT_SECONDS:g}s"}) + "\n"
+            elif error is not None:
+                yield json.dumps({"type": "error", "detail": getattr(error, "detail", str(error))}) + "\n"
+        finally:
+            # Stop the agent run if the client went away
+            task.cancel()
+
+    return StreamingResponse(messages(), media_type="application/x-ndjson")
+
 # --------------------------
 # Run the app (dev only)
 # --------------------------
@@ -3,12 +3,14 @@ uv add streamlit
 streamlit run streamlit_app/ui.py
 """
 
+import json
 import streamlit as st
 import requests
 
 # API_URL = "http://localhost:8000/chat"  # Change this to your public endpoint if deployed
 API_URL = "http://host.docker.internal:8000/chat"
 # API_URL = "http://34.133.6.80/chat"
+STREAM_URL = API_URL + "/stream"  # Streams tokens and tool events as they happen
 
 st.set_page_config(page_title="FIA", page_icon="🤖")
 st.title("Financial Insight Advisor (FIA)")
@@ -36,14 +38,34 @@ if prompt := st.chat_input("Type your message here..."):
         "thread_id": "conversation_1"
     }
 
-    try:
-        response = requests.post(API_URL, json=payload)
-        response.raise_for_status()
-        reply = response.json()["response"]
-    except Exception as e:
-        reply = f"⚠️ API error: {e}"
+    with st.chat_message("ai"):
+        status = st.empty()
+        placeholder = st.empty()
+        reply = ""
+        try:
+            with requests.post(STREAM_URL, json=payload, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "token":
+                        reply += event["content"]
+                        placeholder.markdown(reply + "▌")
+                    elif event["type"] == "tool_start":
+                        status.caption(f"🔧 Using `{event['name']}`...")
+                        reply = ""  # Text before a tool call isn't the answer
+                        placeholder.empty()
+                    elif event["type"] == "tool_end":
+                        status.caption(f"✅ `{event['name']}` done")
+                    elif event["type"] == "final":
+                        reply = event["response"]
+                    elif event["type"] == "error":
+                        reply = f"⚠️ API error: {event['detail']}"
+        except Exception as e:
+            reply = f"⚠️ API error: {e}"
+        status.empty()
+        placeholder.markdown(reply)
 
     # Add AI reply to history
     st.session_state.messages.append({"role": "ai", "content": reply})
-    with st.chat_message("ai"):
-        st.markdown(reply)
@@ -0,0 +1,17 @@
+"""
+News vector search code shared by the lessons.
+
+- local_store: embedded alternative to Qdrant (VECTOR_BACKEND=local)
+- bm25: sparse vectors for hybrid search
+- filters: ticker/date payload filters
+- hybrid: the sparse vector name and the fused dense + sparse query
+
+The news ETL (lesson-04) writes the collections and the agents (lesson-05,
+lesson-06) search them, so both sides must tokenize and filter the same way.
+The root project and lesson-06 install it as an editable path dependency.
+"""
+from .filters import build_filter
+from .hybrid import SPARSE_VECTOR, hybrid_query
+from .local_store import LocalClient
+
+__all__ = ["LocalClient", "SPARSE_VECTOR", "build_filter", "hybrid_query"]
@@ -0,0 +1,43 @@
+"""
+BM25-style sparse vectors for hybrid (lexical + dense) news search.
+
+Text is split into lowercase word tokens (tickers, numbers and names are kept
+whole), each term is hashed to a sparse index, and documents are weighted with
+BM25 term-frequency saturation and length normalization. The IDF part is
+applied at search time from collection statistics (Qdrant sparse vectors with
+Modifier.IDF), so no corpus-wide vocabulary has to be maintained here.
+"""
+import re
+import zlib
+from collections import Counter
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+AVG_DOC_LEN = 180  # Tokens in a typical chunk (chunks are at most 256 model tokens)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.&-][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by s t for from has have in is it its of on or that the their this to was were "
+    "will with".split()
+)
+
+def tokenize(text):
+    """Lowercase word tokens, without stopwords."""
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if token not in STOPWORDS]
+
+def term_index(token):
+    """Stable sparse index for a term (the same in every process)."""
+    return zlib.crc32(token.encode()) & 0x7FFFFFFF
+
+def document_vector(text):
+    """Sparse (indices, values) of a document, with BM25 term-frequency weights."""
+    tokens = tokenize(text)
+    counts = Counter(term_index(token) for token in tokens)
+    norm = K1 * (1 - B + B * len(tokens) / AVG_DOC_LEN)
+    return list(counts), [tf * (K1 + 1) / (tf + norm) for tf in counts.values()]
+
+def query_vector(text):
+    """Sparse (indices, values) of a query: each distinct term weighs 1."""
+    indices = sorted({term_index(token) for token in tokenize(text)})
+    return indices, [1.0] * len(indices)
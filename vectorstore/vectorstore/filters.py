@@ -0,0 +1,44 @@
+"""
+Payload filters for news search, shared by the ETL and the agents.
+"""
+from datetime import date, datetime, timedelta, timezone
+from qdrant_client.models import DatetimeRange, FieldCondition, Filter, MatchAny
+
+def _end_bound(end_date):
+    """
+    Upper bound of a created_at range: a date-only end_date ("2025-06-01")
+    covers that whole day, so it becomes `lt` the next day; a date/time stays `lte`.
+    """
+    if end_date and len(end_date) == 10:
+        try:
+            return {"lt": (date.fromisoformat(end_date) + timedelta(days=1)).isoformat()}
+        except ValueError:
+            pass
+    return {"lte": end_date}
+
+def build_filter(tickers=None, start_date=None, end_date=None, days=None):
+    """
+    Build a payload filter for news search.
+
+    :param tickers: Only articles about any of these tickers
+    :param start_date: Only articles created at or after this ISO 8601 date/time
+    :param end_date: Only articles created at or before this ISO 8601 date/time
+                     (a date without a time includes that whole day)
+    :param days: Only articles from the last N days (overrides start_date)
+    :return: A Filter, or None when no condition is given
+    """
+    conditions = []
+    if tickers:
+        tickers = [ticker.upper() for ticker in tickers]
+        conditions.append(Filter(should=[
+            FieldCondition(key="metadata.ticker", match=MatchAny(any=tickers)),
+            FieldCondition(key="metadata.symbols", match=MatchAny(any=tickers)),
+        ]))
+    if days:
+        start_date = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    if start_date or end_date:
+        conditions.append(FieldCondition(
+            key="metadata.created_at",
+            range=DatetimeRange(gte=start_date, **_end_bound(end_date)),
+        ))
+    return Filter(must=conditions) if conditions else None
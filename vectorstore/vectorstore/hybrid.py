@@ -0,0 +1,30 @@
+"""
+Hybrid (dense + BM25 sparse) news search, shared by the ETL and the agents.
+"""
+from qdrant_client.models import Fusion, FusionQuery, Prefetch, SparseVector
+from . import bm25
+
+# Named sparse vector holding BM25 term weights, for hybrid search
+SPARSE_VECTOR = "text"
+
+def hybrid_query(client, collection_name, query_vector, query_text, limit=3, query_filter=None,
+                 prefetch_limit=None, search_params=None):
+    """
+    Dense + BM25 sparse search, fused with reciprocal rank fusion in one query.
+    Both prefetches use the same filter; each returns prefetch_limit candidates
+    (default 4 * limit). search_params apply to the dense prefetch.
+    Returns the fused points.
+    """
+    indices, values = bm25.query_vector(query_text)
+    prefetch_limit = prefetch_limit or limit * 4
+    response = client.query_points(
+        collection_name=collection_name,
+        prefetch=[
+            Prefetch(query=query_vector, filter=query_filter, params=search_params, limit=prefetch_limit),
+            Prefetch(query=SparseVector(indices=indices, values=values), using=SPARSE_VECTOR,
+                     filter=query_filter, limit=prefetch_limit),
+        ],
+        query=FusionQuery(fusion=Fusion.RRF),
+        limit=limit,
+    )
+    return response.points
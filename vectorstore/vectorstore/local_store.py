@@ -0,0 +1,661 @@
+"""
+Embedded vector store: a local, in-process alternative to Qdrant.
+
+Each collection is a directory with a memory-mapped float32 matrix of vectors
+and a SQLite table of point ids and payloads. Searches over small collections
+(or narrow filters) are scored exactly with one NumPy matrix product; large
+collections are searched through an HNSW index when hnswlib is installed.
+The HNSW index is saved next to the vectors and caught up incrementally with
+points written since it was saved.
+
+LocalClient implements the QdrantClient calls used by qdrant_util and
+vector_search, so either can be passed around as `client`. Select it with
+VECTOR_BACKEND=local (see lesson-04/qdrant.py).
+
+Fields indexed with create_payload_index (keyword and datetime) are kept as
+in-memory columns, so filters on them are evaluated with NumPy instead of a
+Python loop over every payload.
+
+```
+uv add "vectorstore[hnsw]"   # hnswlib
+```
+"""
+import os
+import json
+import math
+import heapq
+import shutil
+import sqlite3
+import logging
+import threading
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+import numpy as np
+from qdrant_client.models import (
+    Batch, DatetimeRange, Distance, FieldCondition, Filter, FusionQuery, Record, ScoredPoint, SparseVector,
+    VectorParams,
+)
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+# Collections (and filter matches) at least this large are searched through HNSW
+HNSW_MIN_POINTS = int(os.getenv("HNSW_MIN_POINTS", "20000"))
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "128"))
+
+# Smallest vector file allocation, in points; the file doubles as it fills up
+MIN_CAPACITY = 1024
+
+# Reciprocal rank fusion constant: score = sum of 1 / (RRF_K + rank)
+RRF_K = 60
+
+# ------------------------------------------------------------------------------
+# Payload Filters
+# ------------------------------------------------------------------------------
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _get_field(payload, key):
+    """Value of a dotted payload key such as 'metadata.ticker'."""
+    value = payload
+    for part in key.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def _to_datetime(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def _in_range(value, range_):
+    if value is None or value == '':
+        return False
+    convert = _to_datetime if isinstance(range_, DatetimeRange) else float
+    value = convert(value)
+    if range_.gt is not None and not value > convert(range_.gt):
+        return False
+    if range_.gte is not None and not value >= convert(range_.gte):
+        return False
+    if range_.lt is not None and not value < convert(range_.lt):
+        return False
+    if range_.lte is not None and not value <= convert(range_.lte):
+        return False
+    return True
+
+def matches(payload, condition):
+    """Evaluate a Qdrant Filter (must/should/must_not, match and range conditions) on a payload."""
+    if isinstance(condition, Filter):
+        if not all(matches(payload, c) for c in _as_list(condition.must)):
+            return False
+        should = _as_list(condition.should)
+        if should and not any(matches(payload, c) for c in should):
+            return False
+        return not any(matches(payload, c) for c in _as_list(condition.must_not))
+
+    if isinstance(condition, FieldCondition):
+        values = _as_list(_get_field(payload, condition.key))
+        if condition.match is not None:
+            if hasattr(condition.match, 'any'):
+                return any(value in condition.match.any for value in values)
+            if hasattr(condition.match, 'value'):
+                return condition.match.value in values
+        if condition.range is not None:
+            return any(_in_range(value, condition.range) for value in values)
+    raise ValueError(f"Unsupported filter condition: {condition!r}")
+
+# ------------------------------------------------------------------------------
+# Payload Indexes
+# ------------------------------------------------------------------------------
+
+class KeywordIndex:
+    """Rows holding each value of a keyword field."""
+    def __init__(self, key):
+        self.key = key
+        self.rows = {}  # value -> set of rows
+
+    def update(self, row, old_payload, payload):
+        if old_payload:
+            for value in _as_list(_get_field(old_payload, self.key)):
+                self.rows.get(value, set()).discard(row)
+        for value in _as_list(_get_field(payload, self.key)):
+            self.rows.setdefault(value, set()).add(row)
+
+    def mask(self, condition, n):
+        """Boolean mask of the first n rows matching a match condition; None if unsupported."""
+        if condition.match is None:
+            return None
+        if hasattr(condition.match, 'any'):
+            values = condition.match.any
+        elif hasattr(condition.match, 'value'):
+            values = [condition.match.value]
+        else:
+            return None
+        mask = np.zeros(n, dtype=bool)
+        for value in values:
+            rows = self.rows.get(value)
+            if rows:
+                mask[np.fromiter(rows, dtype=np.int64, count=len(rows))] = True
+        return mask
+
+class DatetimeIndex:
+    """A datetime field as a float64 column of Unix timestamps (NaN when missing)."""
+    def __init__(self, key):
+        self.key = key
+        self.values = np.empty(0)
+
+    def update(self, row, old_payload, payload):
+        if row >= len(self.values):
+            grown = np.full(max(row + 1, 2 * len(self.values), MIN_CAPACITY), np.nan)
+            grown[:len(self.values)] = self.values
+            self.values = grown
+        value = _get_field(payload, self.key)
+        try:
+            self.values[row] = _to_datetime(value).timestamp() if value not in (None, '') else np.nan
+        except (TypeError, ValueError):
+            self.values[row] = np.nan
+
+    def mask(self, condition, n):
+        """Boolean mask of the first n rows matching a range condition; None if unsupported."""
+        if condition.range is None or isinstance(condition.range, list):
+            return None
+        values = self.values[:n]
+        mask = ~np.isnan(values)
+        bounds = condition.range
+        if bounds.gt is not None:
+            mask &= values > _to_datetime(bounds.gt).timestamp()
+        if bounds.gte is not None:
+            mask &= values >= _to_datetime(bounds.gte).timestamp()
+        if bounds.lt is not None:
+            mask &= values < _to_datetime(bounds.lt).timestamp()
+        if bounds.lte is not None:
+            mask &= values <= _to_datetime(bounds.lte).timestamp()
+        return mask
+
+PAYLOAD_INDEXES = {"keyword": KeywordIndex, "datetime": DatetimeIndex}
+
+# ------------------------------------------------------------------------------
+# Collection
+# ------------------------------------------------------------------------------
+
+class LocalCollection:
+    """
+    One collection on disk:
+    - vectors.f32: float32 matrix, one row per point (unit-normalized for cosine)
+    - points.db: point id -> row, payload, and the version that last wrote it,
+      plus an inverted index of sparse (term, weight) vectors
+    - hnsw.bin / hnsw.json: optional HNSW index and the version it covers
+    Readers pick up points written by other processes on their next search.
+    """
+    def __init__(self, path, size=None, distance=None, sparse_names=()):
+        self.path = path
+        self.conn = sqlite3.connect(os.path.join(path, "points.db"), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS points "
+                "(id PRIMARY KEY, row INTEGER NOT NULL, payload TEXT, version INTEGER NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS points_version ON points (version)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sparse (term INTEGER, row INTEGER, weight REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS sparse_term ON sparse (term)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS sparse_row ON sparse (row)")
+            if size is not None:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)",
+                    [("size", str(size)), ("distance", Distance(distance).value), ("version", "0"),
+                     ("sparse", json.dumps(list(sparse_names)))],
+                )
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        self.size = int(meta["size"])
+        self.distance = Distance(meta["distance"])
+        self.sparse_names = json.loads(meta.get("sparse", "[]"))
+        if self.distance not in (Distance.COSINE, Distance.DOT):
+            raise ValueError(f"Local collections support cosine and dot distance, not {self.distance}")
+
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        if not os.path.exists(self.vectors_path):
+            open(self.vectors_path, "wb").close()
+        self.vectors = None
+        self.capacity = 0
+
+        # In-memory view of points.db, kept current by _refresh
+        self.ids = []        # row -> point id
+        self.payloads = []   # row -> payload
+        self.rows = {}       # point id -> row
+        self.indexes = {}    # payload key -> KeywordIndex / DatetimeIndex
+        self.version = 0
+        self.hnsw = None
+        self.hnsw_dirty = False
+        self.hnsw_warned = False
+        with self.lock:
+            self._refresh()
+
+    def _map_vectors(self):
+        """(Re)map the vector file after it grew."""
+        capacity = os.path.getsize(self.vectors_path) // (self.size * 4)
+        if capacity != self.capacity:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.size)) \
+                if capacity else None
+            self.capacity = capacity
+
+    def _grow(self, count):
+        if count <= self.capacity:
+            return
+        capacity = max(count, 2 * self.capacity, MIN_CAPACITY)
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(capacity * self.size * 4)
+        self._map_vectors()
+
+    def _refresh(self):
+        """Load points written since our last view (by this or another process)."""
+        meta = dict(self.conn.execute("SELECT key, value FROM meta WHERE key IN ('version', 'indexes')"))
+        self._load_indexes(json.loads(meta.get("indexes", "{}")))
+        version = int(meta["version"])
+        if version == self.version:
+            return
+        changed = self.conn.execute(
+            "SELECT id, row, payload FROM points WHERE version > ? ORDER BY row", (self.version,)
+        ).fetchall()
+        for point_id, row, payload in changed:
+            if row >= len(self.ids):
+                self.ids.extend([None] * (row + 1 - len(self.ids)))
+                self.payloads.extend([None] * (row + 1 - len(self.payloads)))
+            old_payload, self.payloads[row] = self.payloads[row], json.loads(payload) if payload else {}
+            self.ids[row] = point_id
+            self.rows[point_id] = row
+            for index in self.indexes.values():
+                index.update(row, old_payload, self.payloads[row])
+        self._map_vectors()
+        if self.hnsw is not None and changed:
+            self._hnsw_add([row for _, row, _ in changed])
+        self.version = version
+
+    def _load_indexes(self, schemas):
+        """Build the payload indexes listed in meta that we don't have yet."""
+        for key, schema in schemas.items():
+            if key not in self.indexes:
+                index = self.indexes[key] = PAYLOAD_INDEXES[schema](key)
+                for row, payload in enumerate(self.payloads):
+                    if payload is not None:
+                        index.update(row, None, payload)
+
+    def create_index(self, key, schema):
+        """Index a keyword or datetime payload field; other schemas are filtered by scanning payloads."""
+        if schema not in PAYLOAD_INDEXES:
+            return
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'indexes'").fetchone()
+            schemas = json.loads(row[0]) if row else {}
+            schemas[key] = schema
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('indexes', ?)", (json.dumps(schemas),)
+            )
+            self._load_indexes(schemas)
+
+    def _filter_mask(self, condition, n):
+        """Boolean mask of the first n rows matching a Filter, using the payload indexes where possible."""
+        if isinstance(condition, Filter):
+            mask = np.ones(n, dtype=bool)
+            for c in _as_list(condition.must):
+                mask &= self._filter_mask(c, n)
+            should = _as_list(condition.should)
+            if should:
+                mask &= np.logical_or.reduce([self._filter_mask(c, n) for c in should])
+            for c in _as_list(condition.must_not):
+                mask &= ~self._filter_mask(c, n)
+            return mask
+        index = self.indexes.get(getattr(condition, 'key', None))
+        mask = index.mask(condition, n) if index is not None else None
+        if mask is None:
+            mask = np.fromiter((matches(self.payloads[row], condition) for row in range(n)), dtype=bool, count=n)
+        return mask
+
+    def count(self):
+        return len(self.ids)
+
+    def upsert(self, ids, vectors, payloads=None, sparse_vectors=None):
+        """
+        Insert or overwrite points; existing ids keep their row.
+        sparse_vectors are optional (indices, values) pairs, one per point.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.size)
+        if self.distance == Distance.COSINE:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        payloads = payloads or [{}] * len(ids)
+
+        with self.lock:
+            self._refresh()
+            assigned = {}
+            next_row = self.count()
+            for point_id in ids:
+                if point_id not in self.rows and point_id not in assigned:
+                    assigned[point_id] = next_row
+                    next_row += 1
+            rows = [self.rows.get(point_id, assigned.get(point_id)) for point_id in ids]
+
+            # Vectors first: rows are only visible once points.db is committed
+            self._grow(next_row)
+            self.vectors[rows] = vectors
+            self.vectors.flush()
+
+            version = self.version + 1
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO points (id, row, payload, version) VALUES (?, ?, ?, ?)",
+                    [(point_id, row, json.dumps(payload), version)
+                     for point_id, row, payload in zip(ids, rows, payloads)],
+                )
+                if sparse_vectors is not None:
+                    self.conn.executemany("DELETE FROM sparse WHERE row = ?", [(row,) for row in rows])
+                    self.conn.executemany(
+                        "INSERT INTO sparse (term, row, weight) VALUES (?, ?, ?)",
+                        [(term, row, weight)
+                         for row, (indices, values) in zip(rows, sparse_vectors)
+                         for term, weight in zip(indices, values)],
+                    )
+                self.conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (str(version),))
+            self._refresh()
+
+    # --------------------------------------------------------------------------
+    # HNSW
+    # --------------------------------------------------------------------------
+
+    def _hnsw_add(self, rows):
+        if self.hnsw.get_max_elements() < self.capacity:
+            self.hnsw.resize_index(self.capacity)
+        self.hnsw.add_items(self.vectors[rows], np.asarray(rows))
+        self.hnsw_dirty = True
+
+    def _hnsw_index(self):
+        """The HNSW index, loaded or built on first use; None for small collections."""
+        if self.count() < HNSW_MIN_POINTS:
+            return None
+        if hnswlib is None:
+            if not self.hnsw_warned:
+                logger.warning(f"hnswlib is not installed; searching {self.count()} points by brute force "
+                               f"(install vectorstore[hnsw]).")
+                self.hnsw_warned = True
+            return None
+        if self.hnsw is not None:
+            return self.hnsw
+
+        index_path = os.path.join(self.path, "hnsw.bin")
+        state_path = os.path.join(self.path, "hnsw.json")
+        self.hnsw = hnswlib.Index(space="ip", dim=self.size)
+        indexed_version = 0
+        if os.path.exists(index_path) and os.path.exists(state_path):
+            with open(state_path) as f:
+                indexed_version = json.load(f)["version"]
+            self.hnsw.load_index(index_path, max_elements=self.capacity)
+        else:
+            logger.info(f"Building HNSW index for {self.count()} points in '{self.path}'.")
+            self.hnsw.init_index(max_elements=self.capacity, ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        self.hnsw.set_ef(HNSW_EF_SEARCH)
+
+        # Catch up with points written after the index was saved
+        stale = [row for (row,) in self.conn.execute(
+            "SELECT row FROM points WHERE version > ?", (indexed_version,)
+        )]
+        if stale:
+            self._hnsw_add(stale)
+        self.save()
+        return self.hnsw
+
+    def save(self):
+        """Persist the HNSW index, if it changed."""
+        if self.hnsw is None or not self.hnsw_dirty:
+            return
+        self.hnsw.save_index(os.path.join(self.path, "hnsw.bin"))
+        with open(os.path.join(self.path, "hnsw.json"), "w") as f:
+            json.dump({"version": self.version}, f)
+        self.hnsw_dirty = False
+
+    # --------------------------------------------------------------------------
+    # Search
+    # --------------------------------------------------------------------------
+
+    def search(self, query_vector, query_filter=None, limit=10):
+        query = np.asarray(query_vector, dtype=np.float32)
+        if self.distance == Distance.COSINE:
+            query = query / (np.linalg.norm(query) or 1)
+
+        with self.lock:
+            self._refresh()
+            n = self.count()
+            allowed = None
+            if query_filter is not None:
+                allowed = np.flatnonzero(self._filter_mask(query_filter, n))
+                n = len(allowed)
+            if n == 0:
+                return []
+            k = min(limit, n)
+
+            index = self._hnsw_index() if n >= HNSW_MIN_POINTS else None
+            if index is not None:
+                allowed_rows = set(allowed.tolist()) if allowed is not None else None
+                labels, distances = index.knn_query(
+                    query, k=k, filter=(lambda row: row in allowed_rows) if allowed_rows is not None else None
+                )
+                rows, scores = labels[0], 1 - distances[0]  # 'ip' distance is 1 - dot product
+            else:
+                # Exact top-k: one matrix-vector product, then a partial sort
+                candidates = self.vectors[:n] if allowed is None else self.vectors[allowed]
+                scores = candidates @ query
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                rows = top if allowed is None else allowed[top]
+                scores = scores[top]
+
+            return [
+                ScoredPoint(id=self.ids[row], version=self.version, score=float(score), payload=self.payloads[row])
+                for row, score in zip(rows.tolist(), scores.tolist())
+            ]
+
+    def search_sparse(self, indices, values, query_filter=None, limit=10):
+        """
+        Sparse dot product over the inverted index, with terms weighted by IDF
+        (same formula as Qdrant's Modifier.IDF).
+        """
+        if not indices:
+            return []
+        query = dict(zip(indices, values))
+        placeholders = ",".join("?" * len(query))
+        with self.lock:
+            self._refresh()
+            n = self.count()
+            df = dict(self.conn.execute(
+                f"SELECT term, COUNT(*) FROM sparse WHERE term IN ({placeholders}) GROUP BY term", list(query)
+            ))
+            scores = {}
+            for term, row, weight in self.conn.execute(
+                f"SELECT term, row, weight FROM sparse WHERE term IN ({placeholders})", list(query)
+            ):
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                scores[row] = scores.get(row, 0.0) + idf * weight * query[term]
+            if query_filter is not None:
+                mask = self._filter_mask(query_filter, n)
+                scores = {row: score for row, score in scores.items() if mask[row]}
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [
+                ScoredPoint(id=self.ids[row], version=self.version, score=score, payload=self.payloads[row])
+                for row, score in best
+            ]
+
+    def scroll(self, limit=10, offset=None):
+        """Points in row order, from row `offset`: (points, next offset or None)."""
+        with self.lock:
+            self._refresh()
+            rows = range(offset or 0, min((offset or 0) + limit, self.count()))
+            points = [Record(id=self.ids[row], payload=self.payloads[row]) for row in rows]
+            return points, (rows.stop if rows.stop < self.count() else None)
+
+    def close(self):
+        with self.lock:
+            self.save()
+            self.conn.close()
+
+def reciprocal_rank_fusion(rankings, limit):
+    """Fuse ranked hit lists: each hit scores the sum of 1 / (RRF_K + rank) over the lists."""
+    scores, hits = {}, {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit.id] = scores.get(hit.id, 0.0) + 1 / (RRF_K + rank)
+            hits.setdefault(hit.id, hit)
+    best = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [
+        ScoredPoint(id=point_id, version=hits[point_id].version, score=scores[point_id], payload=hits[point_id].payload)
+        for point_id in best
+    ]
+
+# ------------------------------------------------------------------------------
+# Client
+# ------------------------------------------------------------------------------
+
+class LocalClient:
+    """
+    Drop-in for the QdrantClient calls used in this repo (collections, aliases,
+    upsert, scroll, search and fused hybrid query_points), storing each collection under `path`.
+    """
+    def __init__(self, path="./vector_store"):
+        self.path = path
+        self.collections = {}
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _aliases(self):
+        try:
+            with open(os.path.join(self.path, "aliases.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _collection(self, name):
+        name = self._aliases().get(name, name)
+        with self.lock:
+            if name not in self.collections:
+                if not self.collection_exists(name):
+                    raise ValueError(f"Collection '{name}' not found")
+                self.collections[name] = LocalCollection(os.path.join(self.path, name))
+            return self.collections[name]
+
+    def collection_exists(self, collection_name):
+        return os.path.isdir(os.path.join(self.path, collection_name))
+
+    def create_collection(self, collection_name, vectors_config, sparse_vectors_config=None, **kwargs):
+        # Quantization and on-disk options don't apply: vectors are memory-mapped float32
+        if self.collection_exists(collection_name):
+            raise ValueError(f"Collection '{collection_name}' already exists")
+        path = os.path.join(self.path, collection_name)
+        os.makedirs(path)
+        with self.lock:
+            self.collections[collection_name] = LocalCollection(
+                path, vectors_config.size, vectors_config.distance, list(sparse_vectors_config or {})
+            )
+        return True
+
+    def delete_collection(self, collection_name):
+        with self.lock:
+            collection = self.collections.pop(collection_name, None)
+        if collection:
+            collection.close()
+        shutil.rmtree(os.path.join(self.path, collection_name), ignore_errors=True)
+        return True
+
+    def get_collection(self, collection_name):
+        collection = self._collection(collection_name)
+        return SimpleNamespace(
+            points_count=collection.count(),
+            config=SimpleNamespace(params=SimpleNamespace(
+                vectors=VectorParams(size=collection.size, distance=collection.distance),
+                sparse_vectors={name: None for name in collection.sparse_names},
+            )),
+        )
+
+    def get_collections(self):
+        names = sorted(
+            name for name in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, name))
+        )
+        return SimpleNamespace(collections=[SimpleNamespace(name=name) for name in names])
+
+    def get_aliases(self):
+        return SimpleNamespace(aliases=[
+            SimpleNamespace(alias_name=alias, collection_name=name) for alias, name in self._aliases().items()
+        ])
+
+    def update_collection_aliases(self, change_aliases_operations):
+        """Apply alias operations and swap the alias file in atomically."""
+        aliases = self._aliases()
+        for operation in change_aliases_operations:
+            if getattr(operation, 'delete_alias', None):
+                aliases.pop(operation.delete_alias.alias_name, None)
+            if getattr(operation, 'create_alias', None):
+                aliases[operation.create_alias.alias_name] = operation.create_alias.collection_name
+        tmp_path = os.path.join(self.path, "aliases.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(aliases, f)
+        os.replace(tmp_path, os.path.join(self.path, "aliases.json"))
+        return True
+
+    def create_payload_index(self, collection_name, field_name, field_schema=None):
+        schema = getattr(field_schema, 'value', field_schema)
+        self._collection(collection_name).create_index(field_name, schema)
+        return True
+
+    def upsert(self, collection_name, points, wait=True):
+        if isinstance(points, Batch):
+            ids, vectors, payloads = points.ids, points.vectors, points.payloads
+        else:
+            ids = [point.id for point in points]
+            vectors = [point.vector for point in points]
+            payloads = [point.payload for point in points]
+
+        # Named vectors: the unnamed ("") dense vector plus an optional sparse one
+        sparse_vectors = None
+        if isinstance(vectors, dict):
+            sparse = [vectors[name] for name in vectors if name != ""]
+            if sparse:
+                sparse_vectors = [(vector.indices, vector.values) for vector in sparse[0]]
+            vectors = vectors[""]
+        self._collection(collection_name).upsert(ids, vectors, payloads, sparse_vectors)
+        return True
+
+    def search(self, collection_name, query_vector, query_filter=None, limit=10, **kwargs):
+        return self._collection(collection_name).search(query_vector, query_filter, limit)
+
+    def scroll(self, collection_name, limit=10, offset=None, **kwargs):
+        # Payloads are always returned; vectors never are
+        return self._collection(collection_name).scroll(limit, offset)
+
+    def query_points(self, collection_name, prefetch, query, limit=10, **kwargs):
+        """Hybrid query: run each dense or sparse prefetch, then fuse them with RRF."""
+        if not isinstance(query, FusionQuery):
+            raise ValueError("Local collections only support fusion queries over prefetches")
+        collection = self._collection(collection_name)
+        rankings = []
+        for p in _as_list(prefetch):
+            if isinstance(p.query, SparseVector):
+                rankings.append(collection.search_sparse(p.query.indices, p.query.values, p.filter, p.limit or 10))
+            else:
+                rankings.append(collection.search(p.query, p.filter, p.limit or 10))
+        return SimpleNamespace(points=reciprocal_rank_fusion(rankings, limit))
+
+    def close(self):
+        with self.lock:
+            for collection in self.collections.values():
+                collection.close()
+            self.collections.clear()